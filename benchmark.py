@@ -0,0 +1,154 @@
+import argparse
+import contextlib
+import csv
+import io
+import json
+import platform
+import random
+import time
+
+from main import DEFAULT_WORLD_SPEC, PDWorld, RLAlgorithm, Sarsa, simulate, simulate2, simulate4
+from profiling import PHASES, StepProfiler
+from randomness import BufferedRandom
+from render import Renderer
+from world_spec import generate_world_spec
+
+
+VARIANTS = ['simulate', 'simulate2', 'simulate4']
+POLICIES = ['PRandom', 'PExploit', 'PGreedy']
+#rng the world and algorithm share: the random.Random the runner uses or a BufferedRandom (randomness.py)
+RNGS = {'random': random.Random, 'buffered': BufferedRandom}
+
+
+#The 5x5 world with 3 agents is the assignment world, every other size/agent count is a generated warehouse
+def benchmark_spec(grid, n_agents, n_cells=3, seed=0):
+    if grid == DEFAULT_WORLD_SPEC['grid_size'][0] and n_agents == len(DEFAULT_WORLD_SPEC['agents']) and n_cells == 3:
+        return DEFAULT_WORLD_SPEC
+    return generate_world_spec((grid, grid), n_agents, n_cells, n_cells, seed=seed)
+
+
+def _run(variant, world, algorithm, policy, steps, seed, renderer, profiler=None, stops=None):
+    if variant == 'simulate':
+        return simulate(world, algorithm, policy, steps, seed, renderer=renderer, profiler=profiler, stops=stops)
+    if variant == 'simulate2':
+        return simulate2(world, algorithm, policy, steps, seed, renderer=renderer, profiler=profiler, stops=stops)
+    return simulate4(world, algorithm, policy, steps, seed, 0, renderer=renderer, profiler=profiler, stops=stops)
+
+
+#Times one simulate variant on one world. The q table is warmed up with `warmup` PRandom steps first (not timed) so
+#PExploit and PGreedy work on a learned table like in the experiments. Output of the simulate functions is thrown away
+#and nothing is drawn unless render_every is set, so the numbers are the cost of the simulation itself. The rates are
+#taken over the steps that actually ran, simulate4 returns early once it reaches its 6th terminal state.
+def benchmark_case(variant, spec, policy, steps, warmup=500, seed=42, render_every=0, profile=False, rng='random'):
+    def setup():
+        rng_instance = RNGS[rng](seed)
+        renderer = Renderer(every=render_every, path=None) if render_every else Renderer.headless(echo=False)
+        renderer.events.echo = False
+        world = PDWorld(randomseed=seed, rng=rng_instance, spec=spec, events=renderer.events)
+        algorithm_class = Sarsa if variant == 'simulate2' else RLAlgorithm
+        algorithm = algorithm_class(learning_rate=0.3, discount_factor=0.5, grid_size=world.grid_size, rng=rng_instance)
+        if warmup:
+            _run(variant, world, algorithm, 'PRandom', warmup, seed, renderer)
+        return world, algorithm, renderer
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        world, algorithm, renderer = setup()
+        stops = []
+        start = time.perf_counter()
+        terminal_states = _run(variant, world, algorithm, policy, steps, seed, renderer, stops=stops)
+        seconds = time.perf_counter() - start
+        steps_run = stops[0][0]
+
+        phases = None
+        if profile:
+            # A second identical run with the profiler on, so its overhead does not end up in the timings above
+            world, algorithm, renderer = setup()
+            profiler = StepProfiler()
+            _run(variant, world, algorithm, policy, steps, seed, renderer, profiler)
+            phases = profiler.report()
+
+    decisions = steps_run * len(world.agents)
+    return {
+        'variant': variant,
+        'grid_size': list(world.grid_size),
+        'n_agents': len(world.agents),
+        'policy': policy,
+        'rng': rng,
+        'steps': steps,
+        'steps_run': steps_run,
+        'agent_decisions': decisions,
+        'seconds': seconds,
+        'steps_per_second': steps_run / seconds,
+        'us_per_decision': seconds / decisions * 1e6,
+        'terminal_states': terminal_states,
+        'phases': phases,
+    }
+
+
+def run_benchmarks(grids=(5,), agents=(3,), policies=POLICIES, variants=VARIANTS, steps=2000, warmup=500, seed=42, render_every=0, profile=False, n_cells=3, verbose=True,
+                   rng='random'):
+    results = []
+    for grid in grids:
+        for n_agents in agents:
+            spec = benchmark_spec(grid, n_agents, n_cells, seed)
+            for variant in variants:
+                for policy in policies:
+                    result = benchmark_case(variant, spec, policy, steps, warmup, seed, render_every, profile, rng)
+                    results.append(result)
+                    if verbose:
+                        print(f"{variant:>9} {grid}x{grid} {n_agents:>3} agents {policy:>8}: "
+                              f"{result['steps_per_second']:10.1f} steps/s, {result['us_per_decision']:8.2f}us per decision")
+    return results
+
+
+#Writes the results as JSON (with some information about the machine) or as a flat CSV when the path ends in .csv
+def write_results(results, path):
+    if path.endswith('.csv'):
+        fields = ['variant', 'grid_size', 'n_agents', 'policy', 'rng', 'steps', 'steps_run', 'agent_decisions', 'seconds',
+                  'steps_per_second', 'us_per_decision', 'terminal_states']
+        phase_fields = [f"{phase}_{key}" for phase in PHASES for key in ('mean', 'share')]
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fields + phase_fields)
+            writer.writeheader()
+            for result in results:
+                row = {field: result[field] for field in fields}
+                row['grid_size'] = 'x'.join(str(size) for size in result['grid_size'])
+                for phase, times in (result['phases'] or {}).items():
+                    if phase in PHASES:
+                        row[f"{phase}_mean"] = times['mean']
+                        row[f"{phase}_share"] = times['share']
+                writer.writerow(row)
+    else:
+        with open(path, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'results': results,
+            }, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the throughput of the simulate loops.")
+    parser.add_argument('--grid', type=int, nargs='+', default=[5], help="grid sizes (square)")
+    parser.add_argument('--agents', type=int, nargs='+', default=[3], help="agent counts")
+    parser.add_argument('--cells', type=int, default=3, help="pickup and dropoff cells in generated worlds")
+    parser.add_argument('--policy', nargs='+', default=POLICIES, choices=POLICIES)
+    parser.add_argument('--variant', nargs='+', default=VARIANTS, choices=VARIANTS)
+    parser.add_argument('--steps', type=int, default=2000)
+    parser.add_argument('--warmup', type=int, default=500, help="untimed PRandom steps before each case")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--render-every', type=int, default=0, help="draw the world every k steps (0 = headless)")
+    parser.add_argument('--profile', action='store_true', help="also break every step down into its phases")
+    parser.add_argument('--rng', default='random', choices=list(RNGS), help="random number generator of the runs")
+    parser.add_argument('--output', default='benchmark_results.json', help="results file (.json or .csv)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.grid, args.agents, args.policy, args.variant, args.steps, args.warmup, args.seed,
+                             args.render_every, args.profile, args.cells, rng=args.rng)
+    write_results(results, args.output)
+    return results
+
+
+if __name__ == '__main__':
+    main()
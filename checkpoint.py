@@ -0,0 +1,167 @@
+import json
+import random
+import struct
+
+import numpy as np
+
+from main import PDWorld, RLAlgorithm, Sarsa
+from qtable import QTable
+from randomness import BufferedRandom
+
+
+ALGORITHMS = {'RLAlgorithm': RLAlgorithm, 'Sarsa': Sarsa}
+
+#A checkpoint is one binary file:
+#   8 bytes   magic b'PDQTABLE'
+#   8 bytes   header length (little endian)
+#   header    JSON with the algorithm class, hyperparameters, actions, table shape, rng state, world state and extras
+#   padding   so the arrays start on a 64 byte boundary
+#   values    the q values as little endian float64 in C order, rows x cols x 2 x actions
+#   visited   one byte per q value, 1 where the entry has been written
+#The arrays are stored raw so load_checkpoint can memory-map them instead of reading the file.
+MAGIC = b'PDQTABLE'
+VERSION = 1
+ALIGNMENT = 64
+
+
+def _rng_state(rng):
+    if rng is None:
+        return None
+    if isinstance(rng, BufferedRandom):
+        return {'kind': 'buffered', 'state': rng.getstate()}
+    if hasattr(rng, 'bit_generator'):
+        return {'kind': 'numpy', 'state': rng.bit_generator.state}
+    if hasattr(rng, 'getstate'):
+        version, internal, gauss = rng.getstate()
+        return {'kind': 'random', 'state': [version, list(internal), gauss]}
+    return None
+
+
+def _set_rng_state(rng, state):
+    if state['kind'] == 'numpy':
+        rng.bit_generator.state = state['state']
+    elif state['kind'] == 'buffered':
+        rng.setstate(state['state'])
+    else:
+        version, internal, gauss = state['state']
+        rng.setstate((version, tuple(internal), gauss))
+
+
+#Everything a simulate function changes in a world, so a checkpoint taken between two phases can carry on exactly
+def _world_state(world):
+    return {
+        'randomseed': world.randomseed,
+        'experiment4': world.experiment4,
+        'agents': {key: [agent.position[0], agent.position[1], agent.has_block] for key, agent in world.agents.items()},
+        'pickup_cells': [[position[0], position[1], blocks] for position, blocks in world.pickup_cells.items()],
+        'dropoff_cells': [[position[0], position[1], blocks] for position, blocks in world.dropoff_cells.items()],
+    }
+
+
+#Saves the q table, the hyperparameters and the rng state of an algorithm (and optionally the state of the world it
+#is running in) so the run can be picked up later. extra is any JSON-able metadata, like the terminal state count
+#simulate4 needs to carry on.
+def save_checkpoint(path, algorithm, world=None, extra=None):
+    q_table = algorithm.q_table
+    header = {
+        'version': VERSION,
+        'algorithm': type(algorithm).__name__,
+        'learning_rate': algorithm.learning_rate,
+        'discount_factor': algorithm.discount_factor,
+        'actions': list(q_table.actions),
+        'shape': list(q_table.array.shape),
+        'rng_state': _rng_state(getattr(algorithm, 'rng', None)),
+        'world': _world_state(world) if world is not None else None,
+        'extra': extra,
+    }
+    encoded = json.dumps(header).encode('utf-8')
+    values_offset = -(-(len(MAGIC) + 8 + len(encoded)) // ALIGNMENT) * ALIGNMENT
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(encoded)))
+        f.write(encoded)
+        f.write(b'\0' * (values_offset - f.tell()))
+        f.write(np.ascontiguousarray(q_table.array, dtype='<f8').tobytes())
+        f.write(np.ascontiguousarray(q_table.visited, dtype=np.uint8).tobytes())
+    return path
+
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a q table checkpoint")
+        (length,) = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(length).decode('utf-8'))
+    if header['version'] != VERSION:
+        raise ValueError(f"Unsupported checkpoint version {header['version']}")
+    header['values_offset'] = -(-(len(MAGIC) + 8 + length) // ALIGNMENT) * ALIGNMENT
+    return header
+
+
+#Loads a checkpoint into a new algorithm of the class it was saved from. With mmap the q table is memory-mapped:
+#mode 'c' (the default) is copy-on-write so the table can keep learning without touching the file, 'r' is read-only
+#and lets many evaluation processes share the same pages, 'r+' writes updates back into the file. With mmap=False
+#the arrays are read into memory. rng is the generator the loaded algorithm should use, it gets the saved state;
+#without one a new random.Random (a BufferedRandom if that is what was saved) with the saved state is made, or the
+#global random module is used if no state was saved. planning_steps turns on Dyna-Q planning for the loaded algorithm,
+#the planner's model is not part of a checkpoint so it starts empty.
+def load_checkpoint(path, mmap=True, mode='c', rng=None, planning_steps=0):
+    header = read_header(path)
+    shape = tuple(header['shape'])
+    offset = header['values_offset']
+    count = int(np.prod(shape))
+    if mmap:
+        values = np.memmap(path, dtype='<f8', mode=mode, offset=offset, shape=shape)
+        visited = np.memmap(path, dtype=np.bool_, mode=mode, offset=offset + count * 8, shape=shape)
+    else:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            values = np.frombuffer(f.read(count * 8), dtype='<f8').reshape(shape).copy()
+            visited = np.frombuffer(f.read(count), dtype=np.bool_).reshape(shape).copy()
+
+    if header['rng_state'] is not None:
+        if rng is None:
+            rng = BufferedRandom() if header['rng_state']['kind'] == 'buffered' else random.Random()
+        _set_rng_state(rng, header['rng_state'])
+    elif rng is None:
+        rng = random
+
+    algorithm_class = ALGORITHMS[header['algorithm']]
+    algorithm = algorithm_class(learning_rate=header['learning_rate'], discount_factor=header['discount_factor'],
+                                actions=header['actions'], grid_size=shape[:2], rng=rng, planning_steps=planning_steps)
+    algorithm.q_table = QTable.from_arrays(values, visited, header['actions'])
+    return algorithm, header
+
+
+#Puts a world back into the state saved with the checkpoint. The world has to be built with the same layout (spec).
+def restore_world(world, header):
+    state = header['world']
+    if state is None:
+        raise ValueError("The checkpoint was saved without a world")
+    snapshot = [int(state['experiment4'])]
+    for key in world.agents:
+        row, col, has_block = state['agents'][key]
+        snapshot += (row, col, int(has_block))
+    pickup_cells = {(row, col): blocks for row, col, blocks in state['pickup_cells']}
+    dropoff_cells = {(row, col): blocks for row, col, blocks in state['dropoff_cells']}
+    snapshot += [pickup_cells[position] for position in world.pickup_layout(state['experiment4'])]
+    snapshot += [dropoff_cells[position] for position in world.dropoff_cells]
+    # restore leaves the rng alone, unlike the world.__init__ reset
+    world.restore(tuple(snapshot))
+    world.randomseed = state['randomseed']
+    return world
+
+
+#Loads a checkpoint saved with a world and rebuilds both, sharing one rng like the runner does, so the next simulate
+#phase continues exactly where the saved run stopped. spec has to be the layout the checkpoint was saved from.
+def resume_checkpoint(path, spec=None, events=None, mmap=True, mode='c', planning_steps=0):
+    algorithm, header = load_checkpoint(path, mmap=mmap, mode=mode, planning_steps=planning_steps)
+    state = header['world']
+    if state is None:
+        raise ValueError("The checkpoint was saved without a world")
+    world = PDWorld(randomseed=state['randomseed'], experiment4=state['experiment4'], events=events, rng=algorithm.rng, spec=spec)
+    restore_world(world, header)
+    # Building the world reseeded the shared rng, put the saved state back
+    if header['rng_state'] is not None:
+        _set_rng_state(algorithm.rng, header['rng_state'])
+    return world, algorithm, header
@@ -0,0 +1,111 @@
+#The ConvergenceTracker watches how much learning is still going on. It is attached to an algorithm
+#(algorithm.tracker) and fed by update_q_table / the Engine on every q update with the old and new value:
+#   - |delta Q| is folded into a running max, sum and count for the current window (O(1) per update)
+#   - the greedy action of the updated state (argmax over the actions applicable when it was taken, the ones the
+#     policy picks from, first one on ties) is compared before and after the update, which is O(actions) per update
+#   - finished episodes are counted with their length in steps
+#Every `window` simulate steps of a phase the window is closed and its summary is added to history. Each phase starts
+#with a fresh window, and the windows of the current phase are history[phase_start:].
+class ConvergenceTracker:
+    def __init__(self, window=500):
+        self.window = window
+        self.history = []
+        self.steps = 0
+        self.phase = -1
+        self.phase_steps = 0
+        self.phase_start = 0
+        self.stop_reason = None
+        self.stopped_at = None
+        self._reset_window()
+
+    def _reset_window(self):
+        self.max_delta = 0.0
+        self.delta_sum = 0.0
+        self.updates = 0
+        self.policy_changes = 0
+        self.episode_steps = []
+
+    #actions are the indices of the actions applicable in the updated state, None for all of them
+    def record_update(self, q, base, index, old_value, new_value, actions=None, n_actions=None):
+        delta = abs(new_value - old_value)
+        if delta > self.max_delta:
+            self.max_delta = delta
+        self.delta_sum += delta
+        self.updates += 1
+        if not delta:
+            return
+        if actions is None:
+            actions = range(n_actions)
+        action = index - base
+        if action not in actions:
+            # A stale queued SARSA action, the greedy choice among the applicable ones did not change
+            return
+        values = [q[base + a] for a in actions]
+        after = values.index(max(values))
+        values[list(actions).index(action)] = old_value
+        if values.index(max(values)) != after:
+            self.policy_changes += 1
+
+    def record_episode(self, steps):
+        self.episode_steps.append(steps)
+
+    def step(self):
+        # Called once per simulate step, returns True when this step closed a window
+        self.steps += 1
+        self.phase_steps += 1
+        if self.phase_steps % self.window:
+            return False
+        self.history.append({
+            'phase': self.phase,
+            'step': self.steps,
+            'updates': self.updates,
+            'max_delta': self.max_delta,
+            'mean_delta': self.delta_sum / self.updates if self.updates else 0.0,
+            'policy_changes': self.policy_changes,
+            'episodes': len(self.episode_steps),
+            'mean_episode_steps': sum(self.episode_steps) / len(self.episode_steps) if self.episode_steps else None,
+        })
+        self._reset_window()
+        return True
+
+    def begin_phase(self):
+        # Whatever was left of the last window of the previous phase is dropped
+        self.phase += 1
+        self.phase_steps = 0
+        self.phase_start = len(self.history)
+        self.stop_reason = None
+        self.stopped_at = None
+        self._reset_window()
+
+
+#A StoppingRule ends a simulate phase early once learning has settled. It is checked whenever the tracker closes a
+#window and fires when, for `patience` windows in a row, the largest |delta Q| stayed below max_delta and the greedy
+#policy changed at most max_policy_changes times. With episode_tolerance set, the mean steps per episode of those
+#windows also have to be within that fraction of each other (windows without a finished episode do not count then).
+#Only windows of the current phase count, and no phase stops before min_steps.
+class StoppingRule:
+    def __init__(self, max_delta=1e-3, max_policy_changes=0, patience=3, window=500, min_steps=0, episode_tolerance=None):
+        self.max_delta = max_delta
+        self.max_policy_changes = max_policy_changes
+        self.patience = patience
+        self.window = window
+        self.min_steps = min_steps
+        self.episode_tolerance = episode_tolerance
+
+    def check(self, tracker, phase_steps):
+        # Returns why the phase should stop, or None to keep going
+        if phase_steps < self.min_steps or len(tracker.history) - tracker.phase_start < self.patience:
+            return None
+        recent = tracker.history[-self.patience:]
+        if any(window['max_delta'] >= self.max_delta for window in recent):
+            return None
+        if any(window['policy_changes'] > self.max_policy_changes for window in recent):
+            return None
+        reason = (f"converged: max |dQ| below {self.max_delta} and at most {self.max_policy_changes} greedy policy "
+                  f"changes for {self.patience} windows of {tracker.window} steps")
+        if self.episode_tolerance is not None:
+            lengths = [window['mean_episode_steps'] for window in recent]
+            if None in lengths or max(lengths) - min(lengths) > self.episode_tolerance * max(lengths):
+                return None
+            reason += f", steps per episode within {self.episode_tolerance:.0%}"
+        return reason
@@ -0,0 +1,302 @@
+from convergence import ConvergenceTracker
+from profiling import NULL_PROFILER
+from render import Renderer
+
+
+#Stop reason returned by Engine.run when simulate4 reaches its 6th terminal state
+TERMINAL_LIMIT = 'terminal state limit reached'
+
+
+#The Engine runs the simulate loops on small ints instead of Agent objects, tuples and action strings. Cells are
+#numbered row * cols + col, actions by their index in algorithm.actions, and the q table is read and written through
+#a flat memoryview of QTable.array (state (row, col, has_block) starts at ((row * qcols + col) * 2 + has_block) * actions).
+#Everything that does not change during a run (legal moves, the cell every move leads to, the applicable action
+#lists of every cell) is built once, so a step is list indexing and float math only.
+#
+#The engine draws random numbers in exactly the same order as RLAlgorithm.select_action and picks from lists of the
+#same length and order, so a run gives the same q table, terminal states and output as the object version for a
+#given seed. The PDWorld is only brought up to date when it is drawn and at the end of a run.
+class Engine:
+    def __init__(self, world, algorithm):
+        self.world = world
+        self.algorithm = algorithm
+        q_table = algorithm.q_table
+        q_table.resize(world.grid_size)
+
+        actions = list(algorithm.actions)
+        self.n_actions = n_actions = len(actions)
+        self.pickup = actions.index('pickup')
+        self.dropoff = actions.index('dropoff')
+        self.is_move = [action in ('north', 'south', 'east', 'west') for action in actions]
+
+        rows, cols = world.grid_size
+        qcols = q_table.array.shape[1]
+        self.cell_positions = [(row, col) for row in range(rows) for col in range(cols)]
+        self.cell_index = {position: cell for cell, position in enumerate(self.cell_positions)}
+        n_cells = len(self.cell_positions)
+        # q index of action 0 in (cell, has_block=False)
+        self.qbase = [(row * qcols + col) * 2 * n_actions for row, col in self.cell_positions]
+        # target[cell * n_actions + action] is the cell a move leads to, -1 when it leaves the grid or is not a move
+        self.target = [-1] * (n_cells * n_actions)
+        self.plain_actions = []
+        for cell, position in enumerate(self.cell_positions):
+            moves = []
+            for direction, neighbor in world.neighbor_table[position].items():
+                action = actions.index(direction)
+                moves.append(action)
+                self.target[cell * n_actions + action] = self.cell_index[neighbor]
+            self.plain_actions.append(moves)
+        self.pickup_actions = [None] * n_cells
+        self.dropoff_actions = [None] * n_cells
+
+        # Flat world state, these lists are filled in place by encode so they can be bound to locals in run
+        self.agent_cells = []
+        self.carrying = []
+        self.occupant = [-1] * n_cells
+        self.blocks = [-1] * n_cells
+        self.room = [0] * n_cells
+        self.pickups_left = 0
+        self.dropoffs_open = 0
+        self.encode()
+
+    def encode(self):
+        # Read the state of the PDWorld into the flat lists
+        world = self.world
+        agents = list(world.agents.values())
+        self.agents = agents
+        self.names = [agent.name for agent in agents]
+        self.agent_cells[:] = [self.cell_index[agent.position] for agent in agents]
+        self.carrying[:] = [agent.has_block for agent in agents]
+        occupant = self.occupant
+        occupant[:] = [-1] * len(occupant)
+        for i, cell in enumerate(self.agent_cells):
+            occupant[cell] = i
+        blocks = self.blocks
+        blocks[:] = [-1] * len(blocks)
+        room = self.room
+        room[:] = [0] * len(room)
+        self.pickup_cells = []
+        self.dropoff_cells = []
+        for position, count in world.pickup_cells.items():
+            cell = self.cell_index[position]
+            blocks[cell] = count
+            self.pickup_cells.append(cell)
+            if self.pickup_actions[cell] is None:
+                self.pickup_actions[cell] = [self.pickup] + self.plain_actions[cell]
+        for position, count in world.dropoff_cells.items():
+            cell = self.cell_index[position]
+            room[cell] = world.dropoff_capacity[position] - count
+            self.dropoff_cells.append(cell)
+            if self.dropoff_actions[cell] is None:
+                self.dropoff_actions[cell] = [self.dropoff] + self.plain_actions[cell]
+        self.pickups_left = sum(1 for cell in self.pickup_cells if blocks[cell] > 0)
+        self.dropoffs_open = sum(1 for cell in self.dropoff_cells if room[cell] > 0)
+
+    def decode(self, full=True):
+        # Write the flat state back into the PDWorld. Drawing only needs positions and counts, full also rebuilds
+        # the world's lookup tables so it is ready to be used on its own again.
+        world = self.world
+        cell_positions = self.cell_positions
+        for agent, cell, carrying in zip(self.agents, self.agent_cells, self.carrying):
+            agent.position = cell_positions[cell]
+            agent.has_block = carrying
+        for cell in self.pickup_cells:
+            world.pickup_cells[cell_positions[cell]] = self.blocks[cell]
+        for cell in self.dropoff_cells:
+            position = cell_positions[cell]
+            world.dropoff_cells[position] = world.dropoff_capacity[position] - self.room[cell]
+        if full:
+            world.build_tables()
+
+    #Runs one simulate phase. sarsa picks the update rule of simulate2 (with its queue of already chosen next actions),
+    #switch_layout the terminal handling of simulate4: the world is reset normally below 3 terminal states, with the
+    #experiment 4 pickups below 6 and the run stops at 6. With a stopping rule (convergence.py) the phase also ends once
+    #the algorithm's tracker says learning has settled. Returns the terminal state count, why the run stopped early
+    #(TERMINAL_LIMIT, the stopping rule's reason, or None when it ran all its steps) and the number of steps it ran.
+    #metrics is a MetricsSink (metrics.py) that gets every decision, terminal state and step.
+    def run(self, policy, steps, randomseed, sarsa=False, terminal_states=0, switch_layout=False, renderer=None,
+            episode_steps=None, profiler=NULL_PROFILER, stopping=None, metrics=None):
+        world = self.world
+        algorithm = self.algorithm
+        if renderer is None:
+            renderer = Renderer.headless()
+            renderer.events = world.events
+        events = world.events
+        rng = algorithm.rng
+        choice = rng.choice
+        draw = rng.random
+        learning_rate = algorithm.learning_rate
+        discount_factor = algorithm.discount_factor
+        n_actions = self.n_actions
+        pickup, dropoff = self.pickup, self.dropoff
+        is_move = self.is_move
+        qbase, target = self.qbase, self.target
+        plain_actions, pickup_actions, dropoff_actions = self.plain_actions, self.pickup_actions, self.dropoff_actions
+        cell_positions = self.cell_positions
+        agent_cells, carrying, occupant, blocks, room = self.agent_cells, self.carrying, self.occupant, self.blocks, self.room
+        pickups_left, dropoffs_open = self.pickups_left, self.dropoffs_open
+        names = self.names
+        n_agents = len(agent_cells)
+        q = memoryview(algorithm.q_table.array.reshape(-1))
+        visited = memoryview(algorithm.q_table.visited.reshape(-1))
+        planner = getattr(algorithm, 'planner', None)
+        # Striped locks of a shared q table (parallel.py), None when the table belongs to this process alone
+        locks = getattr(algorithm, 'locks', None)
+        if stopping is not None and getattr(algorithm, 'tracker', None) is None:
+            algorithm.tracker = ConvergenceTracker(stopping.window)
+        tracker = getattr(algorithm, 'tracker', None)
+        if tracker is not None:
+            tracker.begin_phase()
+        if metrics is not None:
+            metrics.begin_phase(world, algorithm, policy)
+        profile = profiler is not NULL_PROFILER
+        random_policy = policy == 'PRandom'
+        exploit_policy = policy == 'PExploit'
+        if not (random_policy or exploit_policy or policy == 'PGreedy'):
+            raise ValueError(f"Unknown policy {policy}")
+
+        def select(cell, has_block):
+            # RLAlgorithm.select_action and get_best_action on ints
+            if has_block:
+                actions = dropoff_actions[cell] if room[cell] > 0 else plain_actions[cell]
+            else:
+                actions = pickup_actions[cell] if blocks[cell] > 0 else plain_actions[cell]
+            if random_policy or (exploit_policy and not draw() < 0.8):
+                return choice(actions)
+            # The values are read once, another process may be writing to a shared table in between
+            base = qbase[cell] + has_block * n_actions
+            values = [q[base + action] for action in actions]
+            best_q = max(values)
+            return choice([action for action, value in zip(actions, values) if value == best_q])
+
+        def applicable(cell, has_block):
+            # The actions select picks from, for the tracker, kept out of select so it costs nothing without one
+            if has_block:
+                return dropoff_actions[cell] if room[cell] > 0 else plain_actions[cell]
+            return pickup_actions[cell] if blocks[cell] > 0 else plain_actions[cell]
+
+        terminal_count = terminal_states
+        steps_run = steps
+        episode_start = 0
+        queued = [None] * n_agents
+        for step in range(steps):
+            if profile:
+                profiler.start()
+            if pickups_left == 0 and dropoffs_open == 0:
+                events.log(f"Terminal state reached after {step} steps.")
+                # Steps of this episode counted from the start of the phase or the previous terminal state
+                if episode_steps is not None:
+                    episode_steps.append(step - episode_start)
+                if tracker is not None:
+                    tracker.record_episode(step - episode_start)
+                if metrics is not None:
+                    metrics.episode(world.experiment4)
+                episode_start = step
+                terminal_count += 1
+                events.log("TERMINAL STATE COUNT ADDED")
+                events.log(str(terminal_count))
+                if switch_layout and terminal_count >= 6:
+                    self.pickups_left, self.dropoffs_open = pickups_left, dropoffs_open
+                    self.decode()
+                    renderer.render(world)
+                    return terminal_count, TERMINAL_LIMIT, step
+                world.reset(randomseed, experiment4=switch_layout and terminal_count >= 3)
+                # A BufferedRandom (randomness.py) gets new random/choice functions when it is reseeded
+                choice, draw = rng.choice, rng.random
+                self.encode()
+                pickups_left, dropoffs_open = self.pickups_left, self.dropoffs_open
+                queued = [None] * n_agents
+            if profile:
+                profiler.lap('terminal_check')
+
+            for i in range(n_agents):
+                cell = agent_cells[i]
+                has_block = carrying[i]
+                action = queued[i]
+                if action is None:
+                    action = select(cell, has_block)
+                if tracker is not None:
+                    tracked_actions = applicable(cell, has_block)
+                if profile:
+                    profiler.lap('select_action')
+
+                # Agent.move, pickup and dropoff, the checks are repeated because a queued SARSA action can be stale
+                if is_move[action]:
+                    new_cell = target[cell * n_actions + action]
+                    if new_cell >= 0 and occupant[new_cell] < 0:
+                        occupant[cell] = -1
+                        occupant[new_cell] = i
+                        agent_cells[i] = new_cell
+                elif action == pickup:
+                    if not has_block and blocks[cell] > 0:
+                        carrying[i] = True
+                        blocks[cell] -= 1
+                        if blocks[cell] == 0:
+                            pickups_left -= 1
+                        events.log(f"{names[i]} picked up a block at {cell_positions[cell]}.")
+                elif action == dropoff:
+                    if has_block and room[cell] > 0:
+                        carrying[i] = False
+                        room[cell] -= 1
+                        if room[cell] == 0:
+                            dropoffs_open -= 1
+                        events.log(f"{names[i]} dropped off a block at {cell_positions[cell]}.")
+                next_cell = agent_cells[i]
+                next_has_block = carrying[i]
+                base = qbase[cell] + has_block * n_actions
+                index = base + action
+                next_base = qbase[next_cell] + next_has_block * n_actions
+                if profile:
+                    profiler.lap('transition')
+
+                if sarsa:
+                    next_action = select(next_cell, next_has_block)
+                    queued[i] = next_action
+                    if profile:
+                        profiler.lap('select_action')
+                    reward = -1 if is_move[next_action] else 13
+                else:
+                    next_action = None
+                    reward = -1 if is_move[action] else 13
+                if metrics is not None:
+                    metrics.record(i, cell_positions[cell], has_block, action, reward)
+                if locks is not None:
+                    lock = locks[(base // n_actions) % len(locks)]
+                    lock.acquire()
+                current_q = q[index]
+                if sarsa:
+                    q[index] = current_q + learning_rate * (reward + discount_factor * q[next_base + next_action] - current_q)
+                else:
+                    next_max = max(q[next_base:next_base + n_actions])
+                    q[index] = current_q + learning_rate * (reward + discount_factor * next_max - current_q)
+                visited[index] = True
+                if locks is not None:
+                    lock.release()
+                if tracker is not None:
+                    tracker.record_update(q, base, index, current_q, q[index], tracked_actions)
+                if planner is not None:
+                    planner.update(q, index, reward, next_base, next_action, learning_rate, discount_factor)
+                if profile:
+                    profiler.lap('update_q_table')
+
+            if renderer.due():
+                self.pickups_left, self.dropoffs_open = pickups_left, dropoffs_open
+                self.decode(full=False)
+            renderer.render(world)
+            if profile:
+                profiler.lap('render')
+
+            if metrics is not None:
+                metrics.end_step()
+            if tracker is not None and tracker.step() and stopping is not None:
+                reason = stopping.check(tracker, step + 1)
+                if reason is not None:
+                    tracker.stop_reason = reason
+                    tracker.stopped_at = step + 1
+                    steps_run = step + 1
+                    events.log(f"Stopped early after {step + 1} steps, {reason}.")
+                    break
+
+        self.pickups_left, self.dropoffs_open = pickups_left, dropoffs_open
+        self.decode()
+        return terminal_count, tracker.stop_reason if tracker is not None else None, steps_run
@@ -1,84 +1,283 @@
 import random
 
+from qtable import QTable
+from engine import TERMINAL_LIMIT, Engine
+from planning import PrioritizedSweeping
+from profiling import NULL_PROFILER
+from render import EventLog, Renderer
+from world_spec import normalize_world_spec
+
 
 #The agent class is the basis of our 3 agents in out PD world, the move, pickup, and dropoff functions are used in our simulate function 
 #When we are moving around agents around the pdworld based on our algorithm in simulate.
 class Agent:
+    __slots__ = ('position', 'name', 'has_block')
+
     def __init__(self, start_position, name):
         self.position = start_position
         self.name = name
         self.has_block = False
 
     def move(self, direction, world):
-        moves = {'north': (-1, 0), 'south': (1, 0), 'east': (0, 1), 'west': (0, -1)}
-        # Calculate new position
-        new_x = self.position[0] + moves[direction][0]
-        new_y = self.position[1] + moves[direction][1]
-        new_position = (new_x, new_y)
+        # Look up the new position, there is none if the move would leave the grid
+        new_position = world.neighbor_table[self.position].get(direction)
         
         # Check if the new position is within bounds and not occupied by another agent
-        if world.within_bounds(new_position) and not world.is_occupied(new_position, self):
-            self.position = new_position
+        if new_position is not None and not world.is_occupied(new_position, self):
+            world.move_agent(self, new_position)
         
 
     def pickup(self, world):
         #the agent will pick up a block if its in the pickup cell, the number of blocks is greater than 0, and the agent does not have a block
         #This will be called by our simulate function and will be used in the process of determining the action our agents will take
-        if world.is_pickup_cell(self.position) and world.pickup_cells[self.position] > 0 and not self.has_block:
+        if not self.has_block and world.can_pickup(self.position):
             self.has_block = True
-            world.pickup_cells[self.position] -= 1
-            print(f"{self.name} picked up a block at {self.position}.")
+            world.take_block(self.position)
+            world.events.log(f"{self.name} picked up a block at {self.position}.")
     
     def dropoff(self, world):
         #the agent will drop off a block if its in the dropoff cell, the number of blocks is less than 5, and the agent has a block
         #This will be called by our simulate function and will be used in the process of determining the action our agents will take
 
-        if world.is_dropoff_cell(self.position) and world.dropoff_cells[self.position] < 5 and self.has_block:
+        if self.has_block and world.can_dropoff(self.position):
             self.has_block = False
-            world.dropoff_cells[self.position] += 1
-            print(f"{self.name} dropped off a block at {self.position}.")
+            world.place_block(self.position)
+            world.events.log(f"{self.name} dropped off a block at {self.position}.")
      
+#The layout of our PD world, kept at module level so other parts of the project (like the batched VecPDWorld)
+#build the exact same world without having to instantiate a PDWorld first.
+GRID_SIZE = (5, 5)
+BLOCK_CAPACITY = 5
+# Assuming the grid positions are 0-indexed.
+# Adjust the coordinates if your grid is 1-indexed or follows a different system.
+AGENT_STARTS = [
+    ('red', 'Red', (2, 2)),  # Corrected to start in the middle of a 5x5 grid
+    ('blue', 'Blue', (4, 2)),  # Starts on the bottom row, middle column
+    ('black', 'Black', (0, 2))  # Starts on the top row, middle column
+]
+PICKUP_CELLS = [(0, 4), (1, 3), (4, 1)]
+EXPERIMENT4_PICKUP_CELLS = [(2, 4), (3, 3), (4, 2)]
+DROPOFF_CELLS = [(0, 0), (2, 0), (3, 4)]
+
+#The same layout as a world spec (see world_spec.py), this is the world PDWorld builds when it is not given a spec
+DEFAULT_WORLD_SPEC = normalize_world_spec({
+    'grid_size': GRID_SIZE,
+    'capacity': BLOCK_CAPACITY,
+    'agents': AGENT_STARTS,
+    'pickup_cells': PICKUP_CELLS,
+    'dropoff_cells': DROPOFF_CELLS,
+    'experiment4_pickup_cells': EXPERIMENT4_PICKUP_CELLS,
+})
+
+MOVES = [('north', (-1, 0)), ('south', (1, 0)), ('east', (0, 1)), ('west', (0, -1))]
+
+#For every cell of a grid, the moves that stay inside the grid (in north, south, east, west order like
+#get_applicable_actions used to check them) and the cell each of those moves leads to. They only depend on the
+#grid size so they are built once per size and shared by every world, including the ones made on reset.
+_MOVE_TABLES = {}
+
+def build_move_tables(grid_size):
+    if grid_size not in _MOVE_TABLES:
+        move_table = {}
+        neighbor_table = {}
+        for x in range(grid_size[0]):
+            for y in range(grid_size[1]):
+                neighbors = {}
+                for direction, (dx, dy) in MOVES:
+                    if 0 <= x + dx < grid_size[0] and 0 <= y + dy < grid_size[1]:
+                        neighbors[direction] = (x + dx, y + dy)
+                move_table[(x, y)] = list(neighbors)
+                neighbor_table[(x, y)] = neighbors
+        _MOVE_TABLES[grid_size] = (move_table, neighbor_table)
+    return _MOVE_TABLES[grid_size]
+
 #PD world creates our vizualization of our grid and has functions that prevent oddities in the creation of the visuals such
 #as boundary checking, terminal state checks, and determining whether a position is a dropoff cell or pickup cell.
 # THis is where the instantiation of our agents locations and pickup and dropoff locations are in.
 class PDWorld:
-    def __init__(self, randomseed, experiment4 = False):
-        self.grid_size = (5, 5)
-        # Assuming the grid positions are 0-indexed.
-        # Adjust the coordinates if your grid is 1-indexed or follows a different system.
-        self.agents = {
-            'red': Agent((2, 2), 'Red'),  # Corrected to start in the middle of a 5x5 grid
-            'blue': Agent((4, 2), 'Blue'),  # Starts on the bottom row, middle column
-            'black': Agent((0, 2), 'Black')  # Starts on the top row, middle column
-        }
+    def __init__(self, randomseed, experiment4 = False, events=None, rng=None, spec=None):
+        # The layout comes from a world spec (a dict or the path of a JSON file), by default our 5x5 world.
+        # Like the event log and random generator it survives the world.__init__ calls used to reset the world.
+        if spec is not None:
+            self.spec = normalize_world_spec(spec)
+        elif not hasattr(self, 'spec'):
+            self.spec = DEFAULT_WORLD_SPEC
+        self.grid_size = self.spec['grid_size']
+        # The event log and random generator survive the world.__init__ calls the simulate functions use to reset the world
+        if events is not None:
+            self.events = events
+        elif not hasattr(self, 'events'):
+            self.events = EventLog()
+        # rng is anything with seed/random/choice (a random.Random for isolated runs), by default the global random module
+        if rng is not None:
+            self.rng = rng
+        elif not hasattr(self, 'rng'):
+            self.rng = random
+        self.agents = {key: Agent(position, name) for key, name, position in self.spec['agents']}
         
         #Will change the pickup locations if we using experiment 4
         self.experiment4 = experiment4
-        if self.experiment4 == False:
+        if self.experiment4 == False or self.spec['experiment4_pickup_cells'] is None:
 
-            self.pickup_cells = {(0, 4): 5, (1, 3): 5, (4, 1): 5}
+            self.pickup_cells = dict(self.spec['pickup_cells'])
         else:
-            print("changed pickup positions")
-            self.pickup_cells = {(2, 4): 5, (3, 3): 5, (4, 2): 5}
+            self.events.log("changed pickup positions")
+            self.pickup_cells = dict(self.spec['experiment4_pickup_cells'])
             
-        self.dropoff_cells = {(0, 0): 0, (2, 0): 0, (3, 4): 0}
+        # How many blocks each dropoff cell can hold
+        self.dropoff_capacity = self.spec['dropoff_cells']
+        self.dropoff_cells = {position: 0 for position in self.dropoff_capacity}
+        
+        self.build_tables()
         
         self.randomseed = randomseed
-        random.seed(self.randomseed)
+        self.rng.seed(self.randomseed)
+
+    #The state of a world as one flat tuple of ints: the experiment 4 flag, row, col and has_block of every agent, the
+    #blocks left on every pickup cell and the blocks on every dropoff cell (in spec order). Everything else in a
+    #PDWorld follows from the spec, so this is all restore needs to put the world back.
+    def snapshot(self):
+        state = [int(self.experiment4)]
+        for agent in self.agents.values():
+            state += (agent.position[0], agent.position[1], int(agent.has_block))
+        state += self.pickup_cells.values()
+        state += self.dropoff_cells.values()
+        return tuple(state)
+
+    def initial_state(self, experiment4=False):
+        # The snapshot of a freshly created world, what world.__init__ would set up
+        state = [int(experiment4)]
+        for key, name, position in self.spec['agents']:
+            state += (position[0], position[1], 0)
+        state += self.pickup_layout(experiment4).values()
+        state += (0,) * len(self.dropoff_capacity)
+        return tuple(state)
+
+    def pickup_layout(self, experiment4=False):
+        if experiment4 and self.spec['experiment4_pickup_cells'] is not None:
+            return self.spec['experiment4_pickup_cells']
+        return self.spec['pickup_cells']
+
+    def restore(self, state):
+        # Puts the world in a snapshotted state in place. Only the cells the agents leave and enter change in the
+        # occupancy grid, the lookup tables are only rebuilt when the snapshot uses the other pickup layout.
+        self.experiment4 = bool(state[0])
+        occupancy = self.occupancy
+        for agent in self.agents.values():
+            occupancy[agent.position[0]][agent.position[1]] = None
+        i = 1
+        for agent in self.agents.values():
+            agent.position = (state[i], state[i + 1])
+            agent.has_block = bool(state[i + 2])
+            occupancy[state[i]][state[i + 1]] = agent
+            i += 3
+        layout = self.pickup_layout(self.experiment4)
+        if layout.keys() != self.pickup_cells.keys():
+            self.pickup_cells = dict(zip(layout, state[i:i + len(layout)]))
+            for j, position in enumerate(self.dropoff_cells, i + len(layout)):
+                self.dropoff_cells[position] = state[j]
+            self.build_tables()
+            return
+        self.pickup_available = 0
+        for position, blocks in zip(self.pickup_cells, state[i:i + len(layout)]):
+            self.pickup_cells[position] = blocks
+            if blocks > 0:
+                self.pickup_available |= self.pickup_bits[position]
+        self.dropoff_available = 0
+        for j, position in enumerate(self.dropoff_cells, i + len(layout)):
+            self.dropoff_cells[position] = state[j]
+            if state[j] < self.dropoff_capacity[position]:
+                self.dropoff_available |= self.dropoff_bits[position]
+
+    def reset(self, randomseed=None, experiment4=False):
+        # Same as the world.__init__(randomseed, experiment4) reset, including the message and the reseed of the rng,
+        # but it keeps the Agent objects and lookup tables instead of building them again
+        if experiment4 and self.spec['experiment4_pickup_cells'] is not None:
+            self.events.log("changed pickup positions")
+        self.restore(self.initial_state(experiment4))
+        if randomseed is not None:
+            self.randomseed = randomseed
+        self.rng.seed(self.randomseed)
+
+    def clone(self, events=None, rng=None):
+        # A second world in the same state for lookahead or evaluation rollouts. The spec and the lookup tables that
+        # never change are shared, only the agents, cell counts and occupancy grid are copied. By default the clone
+        # logs to its own quiet event log and shares the rng, pass rng to give it an independent stream.
+        world = object.__new__(PDWorld)
+        world.__dict__.update(self.__dict__)
+        world.events = events if events is not None else EventLog(echo=False)
+        world.rng = rng if rng is not None else self.rng
+        world.agents = {key: Agent(agent.position, agent.name) for key, agent in self.agents.items()}
+        for key, agent in world.agents.items():
+            agent.has_block = self.agents[key].has_block
+        world.pickup_cells = dict(self.pickup_cells)
+        world.dropoff_cells = dict(self.dropoff_cells)
+        world.occupancy = [[None] * self.grid_size[1] for _ in range(self.grid_size[0])]
+        for agent in world.agents.values():
+            world.occupancy[agent.position[0]][agent.position[1]] = agent
+        return world
+
+    def build_tables(self):
+        # Lookup tables so moving and listing actions never have to scan agents or check bounds:
+        # the occupancy grid holds the agent standing on each cell (or None) and is kept up to date by move_agent,
+        # each pickup/dropoff cell gets a bit and the availability masks have that bit set while the cell has
+        # blocks left (pickup) or room left (dropoff).
+        self.move_table, self.neighbor_table = build_move_tables(self.grid_size)
+        self.occupancy = [[None] * self.grid_size[1] for _ in range(self.grid_size[0])]
+        for agent in self.agents.values():
+            self.occupancy[agent.position[0]][agent.position[1]] = agent
+        self.pickup_bits = {position: 1 << i for i, position in enumerate(self.pickup_cells)}
+        self.dropoff_bits = {position: 1 << i for i, position in enumerate(self.dropoff_cells)}
+        self.pickup_available = 0
+        for position, blocks in self.pickup_cells.items():
+            if blocks > 0:
+                self.pickup_available |= self.pickup_bits[position]
+        self.dropoff_available = 0
+        for position, blocks in self.dropoff_cells.items():
+            if blocks < self.dropoff_capacity[position]:
+                self.dropoff_available |= self.dropoff_bits[position]
+        # The full applicable action lists, shared between calls so they must not be modified
+        self.pickup_actions = {position: ['pickup'] + self.move_table[position] for position in self.pickup_cells}
+        self.dropoff_actions = {position: ['dropoff'] + self.move_table[position] for position in self.dropoff_cells}
     
     def is_occupied(self, position, current_agent):
-        # Check all agents to see if any occupy the given position
-        for name, agent in self.agents.items():
-            if agent != current_agent and agent.position == position:
-                return True
-        return False
+        # Check the occupancy grid to see if another agent occupies the given position
+        occupant = self.occupancy[position[0]][position[1]]
+        return occupant is not None and occupant is not current_agent
+
+    def move_agent(self, agent, new_position):
+        self.occupancy[agent.position[0]][agent.position[1]] = None
+        self.occupancy[new_position[0]][new_position[1]] = agent
+        agent.position = new_position
+
+    def can_pickup(self, position):
+        return self.pickup_available & self.pickup_bits.get(position, 0) != 0
+
+    def can_dropoff(self, position):
+        return self.dropoff_available & self.dropoff_bits.get(position, 0) != 0
+
+    def take_block(self, position):
+        self.pickup_cells[position] -= 1
+        if self.pickup_cells[position] == 0:
+            self.pickup_available &= ~self.pickup_bits[position]
+
+    def place_block(self, position):
+        self.dropoff_cells[position] += 1
+        if self.dropoff_cells[position] >= self.dropoff_capacity[position]:
+            self.dropoff_available &= ~self.dropoff_bits[position]
+
+    def applicable_actions(self, position, has_block):
+        # Same actions in the same order as checking dropoff, pickup, north, south, east and west one by one
+        if has_block:
+            if self.dropoff_available & self.dropoff_bits.get(position, 0):
+                return self.dropoff_actions[position]
+        elif self.pickup_available & self.pickup_bits.get(position, 0):
+            return self.pickup_actions[position]
+        return self.move_table[position]
     
     def check_terminal_state(self):
-        # Check if all pickup locations are empty
-        all_picked = all(blocks == 0 for blocks in self.pickup_cells.values())
-        # Check if all dropoff locations are at capacity
-        all_dropped = all(blocks == 5 for blocks in self.dropoff_cells.values())
-        return all_picked and all_dropped
+        # All pickup locations are empty and all dropoff locations are at capacity once no bit is left in either mask
+        return self.pickup_available == 0 and self.dropoff_available == 0
     
     
     def is_dropoff_cell(self, position):
@@ -91,7 +290,7 @@ class PDWorld:
         x, y = position
         return 0 <= x < self.grid_size[0] and 0 <= y < self.grid_size[1]
 
-    def display_world(self):
+    def render_text(self):
         grid = [['.' for _ in range(self.grid_size[1])] for _ in range(self.grid_size[0])]
         for pos, blocks in self.pickup_cells.items():
             grid[pos[0]][pos[1]] = 'P' + str(blocks)
@@ -99,7 +298,10 @@ class PDWorld:
             grid[pos[0]][pos[1]] = 'D' + str(blocks)
         for agent in self.agents.values():
             grid[agent.position[0]][agent.position[1]] = agent.name[0] + ('(B)' if agent.has_block else '')
-        print('\n'.join(' '.join(row) for row in grid))
+        return '\n'.join(' '.join(row) for row in grid)
+
+    def display_world(self):
+        print(self.render_text())
         print()
         
 #This is our regular Q-learning algorithm with a q table function and policies instantiated within. This algorithm function
@@ -108,59 +310,60 @@ class PDWorld:
 #the get_applicable_actions function. This also has our qtable function which has our q-learning equation and is a big factor on
 #what our pvalues for our pd world will be.
 class RLAlgorithm:
-    def __init__(self, learning_rate=0.1, discount_factor=0.9, actions=['north', 'south', 'east', 'west', 'pickup', 'dropoff']):
-        self.q_table = {}
+    def __init__(self, learning_rate=0.1, discount_factor=0.9, actions=['north', 'south', 'east', 'west', 'pickup', 'dropoff'], grid_size=(5, 5), rng=random, planning_steps=0):
+        self.q_table = QTable(grid_size, actions)
         self.learning_rate = learning_rate
         self.discount_factor = discount_factor
         self.actions = actions
+        # Should be the same generator the world reseeds on reset so a run only depends on its seed
+        self.rng = rng
+        # Dyna-Q planning mode: after every real update run up to planning_steps backups on a learned model
+        self.planner = PrioritizedSweeping(len(actions), planning_steps, sarsa=isinstance(self, Sarsa)) if planning_steps else None
+        # Optional ConvergenceTracker (convergence.py) fed with every update
+        self.tracker = None
     
     def select_action(self, state, policy, world):
         position, has_block = state
         applicable_actions = self.get_applicable_actions(position, has_block, world)
         
         if policy == 'PRandom':
-            return random.choice(applicable_actions)
+            return self.rng.choice(applicable_actions)
         
         if policy == 'PExploit':
             # With probability 0.8, exploit; with probability 0.2, explore
-            if random.random() < 0.8:
+            if self.rng.random() < 0.8:
                 return self.get_best_action(state, applicable_actions)
             else:
-                return random.choice(applicable_actions)
+                return self.rng.choice(applicable_actions)
         
         if policy == 'PGreedy':
             return self.get_best_action(state, applicable_actions)
 
     def get_best_action(self, state, applicable_actions):
         # Fetch the best action based on Q-values from applicable actions
-        best_q_value = max(self.q_table.get((state, action), 0) for action in applicable_actions)
-        best_actions = [action for action in applicable_actions if self.q_table.get((state, action), 0) == best_q_value]
-        return random.choice(best_actions)  # Break ties randomly
+        return self.q_table.best_action(state, applicable_actions, self.rng)  # Break ties randomly
 
     def get_applicable_actions(self, position, has_block, world):
-        # Determine actions that are actually possible in the current state
-        applicable_actions = []
-        if world.is_dropoff_cell(position) and has_block and world.dropoff_cells[position] < 5:
-            applicable_actions.append('dropoff')
-        if world.is_pickup_cell(position) and not has_block and world.pickup_cells[position] > 0:
-            applicable_actions.append('pickup')
-        if world.within_bounds((position[0] - 1, position[1])):  # North
-            applicable_actions.append('north')
-        if world.within_bounds((position[0] + 1, position[1])):  # South
-            applicable_actions.append('south')
-        if world.within_bounds((position[0], position[1] + 1)):  # East
-            applicable_actions.append('east')
-        if world.within_bounds((position[0], position[1] - 1)):  # West
-            applicable_actions.append('west')
-        return applicable_actions
+        # Determine actions that are actually possible in the current state, this is a table lookup in the world
+        return world.applicable_actions(position, has_block)
     
     
-    def update_q_table(self, current_state, action, reward, next_state, policy):
-        if (current_state, action) not in self.q_table:
-            self.q_table[(current_state, action)] = 0
-        
-        next_max = max(self.q_table.get((next_state, a), 0) for a in self.actions)
-        self.q_table[(current_state, action)] += self.learning_rate * (reward + self.discount_factor * next_max - self.q_table[(current_state, action)])
+    #applicable_actions are the actions the policy picked action from, the tracker compares greedy actions among them
+    #(all actions when they are not given)
+    def update_q_table(self, current_state, action, reward, next_state, policy, applicable_actions=None):
+        current_q = self.q_table.value(current_state, action)
+        next_max = self.q_table.max_value(next_state)
+        new_q = current_q + self.learning_rate * (reward + self.discount_factor * next_max - current_q)
+        self.q_table.update(current_state, action, new_q)
+        if self.tracker is not None:
+            indices = None if applicable_actions is None else [self.q_table.action_index[a] for a in applicable_actions]
+            self.tracker.record_update(self.q_table.flat_values(), self.q_table.state_base(current_state),
+                                       self.q_table.flat_index(current_state, action), current_q, new_q, indices,
+                                       len(self.actions))
+        if self.planner is not None:
+            self.q_table.resize((next_state[0][0] + 1, next_state[0][1] + 1))
+            self.planner.update(self.q_table.flat_values(), self.q_table.flat_index(current_state, action), reward,
+                                self.q_table.state_base(next_state), None, self.learning_rate, self.discount_factor)
         
 
     def print_q_table(self):
@@ -177,11 +380,17 @@ class RLAlgorithm:
 #and our applicable actions function.
 
 class Sarsa(RLAlgorithm):
-    def __init__(self, learning_rate=0.1, discount_factor=0.9, actions=['north', 'south', 'east', 'west', 'pickup', 'dropoff']):
-        self.q_table = {}
+    def __init__(self, learning_rate=0.1, discount_factor=0.9, actions=['north', 'south', 'east', 'west', 'pickup', 'dropoff'], grid_size=(5, 5), rng=random, planning_steps=0):
+        self.q_table = QTable(grid_size, actions)
         self.learning_rate = learning_rate
         self.discount_factor = discount_factor
         self.actions = actions
+        # Should be the same generator the world reseeds on reset so a run only depends on its seed
+        self.rng = rng
+        # Dyna-Q planning mode: after every real update run up to planning_steps backups on a learned model
+        self.planner = PrioritizedSweeping(len(actions), planning_steps, sarsa=isinstance(self, Sarsa)) if planning_steps else None
+        # Optional ConvergenceTracker (convergence.py) fed with every update
+        self.tracker = None
      
         
     def select_action(self, state, policy, world):
@@ -189,47 +398,42 @@ class Sarsa(RLAlgorithm):
         applicable_actions = self.get_applicable_actions(position, has_block, world)
         
         if policy == 'PRandom':
-            return random.choice(applicable_actions)
+            return self.rng.choice(applicable_actions)
         
         if policy == 'PExploit':
             # With probability 0.8, exploit; with probability 0.2, explore
-            if random.random() < 0.8:
+            if self.rng.random() < 0.8:
                 return self.get_best_action(state, applicable_actions)
             else:
-                return random.choice(applicable_actions)
+                return self.rng.choice(applicable_actions)
         
         if policy == 'PGreedy':
             return self.get_best_action(state, applicable_actions)
 
     def get_best_action(self, state, applicable_actions):
         # Fetch the best action based on Q-values from applicable actions
-        best_q_value = max(self.q_table.get((state, action), 0) for action in applicable_actions)
-        best_actions = [action for action in applicable_actions if self.q_table.get((state, action), 0) == best_q_value]
-        return random.choice(best_actions)  # Break ties randomly
+        return self.q_table.best_action(state, applicable_actions, self.rng)  # Break ties randomly
 
     def get_applicable_actions(self, position, has_block, world):
-        # Determine actions that are actually possible in the current state
-        applicable_actions = []
-        if world.is_dropoff_cell(position) and has_block and world.dropoff_cells[position] < 5:
-            applicable_actions.append('dropoff')
-        if world.is_pickup_cell(position) and not has_block and world.pickup_cells[position] > 0:
-            applicable_actions.append('pickup')
-        if world.within_bounds((position[0] - 1, position[1])):  # North
-            applicable_actions.append('north')
-        if world.within_bounds((position[0] + 1, position[1])):  # South
-            applicable_actions.append('south')
-        if world.within_bounds((position[0], position[1] + 1)):  # East
-            applicable_actions.append('east')
-        if world.within_bounds((position[0], position[1] - 1)):  # West
-            applicable_actions.append('west')
-        return applicable_actions
+        # Determine actions that are actually possible in the current state, this is a table lookup in the world
+        return world.applicable_actions(position, has_block)
     
     
-    def update_q_table(self, current_state, action, reward, next_state, next_action, policy):
-        if (current_state, action) not in self.q_table:
-            self.q_table[(current_state, action)] = 0
-        target = reward + self.discount_factor * self.q_table.get((next_state, next_action), 0)
-        self.q_table[(current_state, action)] += self.learning_rate * (target - self.q_table[(current_state, action)])
+    def update_q_table(self, current_state, action, reward, next_state, next_action, policy, applicable_actions=None):
+        current_q = self.q_table.value(current_state, action)
+        target = reward + self.discount_factor * self.q_table.value(next_state, next_action)
+        new_q = current_q + self.learning_rate * (target - current_q)
+        self.q_table.update(current_state, action, new_q)
+        if self.tracker is not None:
+            indices = None if applicable_actions is None else [self.q_table.action_index[a] for a in applicable_actions]
+            self.tracker.record_update(self.q_table.flat_values(), self.q_table.state_base(current_state),
+                                       self.q_table.flat_index(current_state, action), current_q, new_q, indices,
+                                       len(self.actions))
+        if self.planner is not None:
+            self.q_table.resize((next_state[0][0] + 1, next_state[0][1] + 1))
+            self.planner.update(self.q_table.flat_values(), self.q_table.flat_index(current_state, action), reward,
+                                self.q_table.state_base(next_state), self.q_table.action_index[next_action],
+                                self.learning_rate, self.discount_factor)
     
     def print_q_table(self):
         # Print the Q-table in a formatted manner
@@ -247,109 +451,64 @@ class Sarsa(RLAlgorithm):
 #based on the policy and returns the best action, this action moves the agents in all sorts of directions. After the 
 #agent is moved, the q value is updated alonside with it our q table is outputted when we finish all the steps values specified.
 #the movement of the agent is resulted in our visualization which is called under world.displayworld()
-def simulate(world, algorithm, policy, steps,randomseed):
-    terminalStateCount = 0
-    for step in range(steps):
-        if world.check_terminal_state():
-            print(f"Terminal state reached after {step} steps.")
-            terminalStateCount += 1
-            print("TERMINAL STATE COUNT ADDED")
-            print(terminalStateCount)
-            world.__init__(randomseed=randomseed)  
-        for name, agent in world.agents.items():
-            state = (agent.position, agent.has_block)
-            action = algorithm.select_action(state, policy,world)
-            # print(f"Current State of {name}: {state}")
-            # print(f"{name} takes action: {action}")
-            if action in ['north', 'south', 'east', 'west']:
-                agent.move(action, world)
-            elif action == 'pickup':
-                agent.pickup(world)
-            elif action == 'dropoff':
-                agent.dropoff(world)
-            next_state = (agent.position, agent.has_block)
-            reward = -1 if action in ['north', 'south', 'east', 'west'] else 13
-            algorithm.update_q_table(state, action, reward, next_state, policy)
-        world.display_world()
+#The steps themselves run in the integer encoded Engine (engine.py), which gives the same results for a given seed.
+#Like episode_steps, stops is an optional list, it gets (steps actually run, reason the phase stopped early or None).
+def simulate(world, algorithm, policy, steps,randomseed, renderer=None, episode_steps=None, profiler=None, stopping=None, metrics=None, stops=None):
+    renderer = renderer if renderer is not None else Renderer()
+    profiler = profiler if profiler is not None else NULL_PROFILER
+    world.events = renderer.events
+    terminalStateCount, stop_reason, steps_run = Engine(world, algorithm).run(
+        policy, steps, randomseed, renderer=renderer, episode_steps=episode_steps, profiler=profiler, stopping=stopping,
+        metrics=metrics)
+    if stops is not None:
+        stops.append((steps_run, stop_reason))
+    renderer.finish()
     if(steps > 500):
         algorithm.print_q_table()
+    return terminalStateCount
     
     
 #Experiment 2/3    
 #This simulate function is very similar to the first simulate function however it is built for SARSA/
 #What differs is the implementation of a queue helps remember the action that has already been determined. This 
 #helps determine the guarenteed next action for our agent.
-def simulate2(world, algorithm, policy, steps, randomseed):
-    Actions = ['','','']
-    terminal_counter = 0
-    for step in range(steps):                                                                                                                               
-        if world.check_terminal_state():
-            print(f"Terminal state reached after {step} steps.")
-            terminal_counter+=1
-            print("TERMINAL STATE COUNT ADDED")
-            print(terminal_counter)
-            world.__init__(randomseed=randomseed)                                                                                                                                                                                                
-            Actions = ['','','']
-        for name, agent in world.agents.items():
-            state = (agent.position, agent.has_block)
-            if Actions[0] == '':
-                action = algorithm.select_action(state, policy,world)
-            else:
-                action = Actions[0]
-            if action in ['north', 'south', 'east', 'west']:
-                agent.move(action, world)
-            elif action == 'pickup':
-                agent.pickup(world)
-            elif action == 'dropoff':
-                agent.dropoff(world)
-            next_state = (agent.position, agent.has_block)
-            next_action = algorithm.select_action(next_state, policy, world)
-            Actions.pop(0)
-            Actions.append(next_action)
-            reward = -1 if next_action in ['north', 'south', 'east', 'west'] else 13
-            algorithm.update_q_table(state, action, reward, next_state, next_action, policy)
-        world.display_world()
+def simulate2(world, algorithm, policy, steps, randomseed, renderer=None, episode_steps=None, profiler=None, stopping=None, metrics=None, stops=None):
+    renderer = renderer if renderer is not None else Renderer()
+    profiler = profiler if profiler is not None else NULL_PROFILER
+    world.events = renderer.events
+    terminal_counter, stop_reason, steps_run = Engine(world, algorithm).run(
+        policy, steps, randomseed, sarsa=True, renderer=renderer, episode_steps=episode_steps, profiler=profiler,
+        stopping=stopping, metrics=metrics)
+    if stops is not None:
+        stops.append((steps_run, stop_reason))
+    renderer.finish()
     if(steps > 500):
         algorithm.print_q_table()     
+    return terminal_counter
 
     
 #experiment 4 works very similar to experiment 2/3 however with the implementation of the terminal state conditions
 #where if its less than 3, reset the pd world like normal and if it's greater than 3 or less than 6, reset the pdworld but
 #with the experiment4 variable enabled, this changes the pickup locations to the new locations in our PD world class specified in our requriements
 #Once it reaches 6, the program terminates completely.
-def simulate4(world, algorithm, policy, steps, randomseed, TerminalStates):
-    terminalStateCount = TerminalStates
-    for step in range(steps):
-        if world.check_terminal_state():
-            print(f"Terminal state reached after {step} steps.")
-            terminalStateCount += 1
-            print("TERMINAL STATE COUNT ADDED")
-            print(terminalStateCount)
-            if terminalStateCount < 3:
-                world.__init__(randomseed=randomseed)
-            elif terminalStateCount < 6:
-                world.__init__(randomseed=randomseed, experiment4=True)
-            else:
-                world.display_world()
-                return
-        for name, agent in world.agents.items():
-            state = (agent.position, agent.has_block)
-            action = algorithm.select_action(state, policy, world)
-            if action in ['north', 'south', 'east', 'west']:
-                agent.move(action, world)
-            elif action == 'pickup':
-                agent.pickup(world)
-            elif action == 'dropoff':
-                agent.dropoff(world)
-            next_state = (agent.position, agent.has_block)
-            reward = -1 if action in ['north', 'south', 'east', 'west'] else 13
-            algorithm.update_q_table(state, action, reward, next_state, policy)
-        world.display_world()
+def simulate4(world, algorithm, policy, steps, randomseed, TerminalStates, renderer=None, episode_steps=None, profiler=None, stopping=None, metrics=None, stops=None):
+    renderer = renderer if renderer is not None else Renderer()
+    profiler = profiler if profiler is not None else NULL_PROFILER
+    world.events = renderer.events
+    terminalStateCount, stop_reason, steps_run = Engine(world, algorithm).run(
+        policy, steps, randomseed, terminal_states=TerminalStates, switch_layout=True, renderer=renderer,
+        episode_steps=episode_steps, profiler=profiler, stopping=stopping, metrics=metrics)
+    if stops is not None:
+        stops.append((steps_run, stop_reason))
+    renderer.finish()
+    if stop_reason == TERMINAL_LIMIT:
+        return terminalStateCount
     if(steps > 500):
         algorithm.print_q_table()
     
-    if not world.check_terminal_state():
-        print(f"Simulation ended without reaching the terminal state after {steps} steps.")
+    if stop_reason is None and not world.check_terminal_state():
+        world.events.log(f"Simulation ended without reaching the terminal state after {steps} steps.")
+        world.events.flush()
     # algorithm.print_q_table()  # Print the Q-table at the end of the simulation
     return terminalStateCount
 
@@ -0,0 +1,136 @@
+import csv
+import json
+import os
+
+import numpy as np
+
+
+#Fixed schemas of the two record tables. step is counted over all phases written to the same sink, phase is the index
+#of the simulate call, agent and action are indices into the names in schema.json.
+STEP_COLUMNS = [('phase', np.int32), ('step', np.int64), ('agent', np.int16), ('row', np.int16), ('col', np.int16),
+                ('has_block', np.int8), ('action', np.int8), ('reward', np.float64)]
+EPISODE_COLUMNS = [('phase', np.int32), ('episode', np.int64), ('end_step', np.int64), ('steps', np.int64),
+                   ('total_reward', np.float64), ('experiment4', np.int8)]
+
+
+#The MetricsSink streams what the simulate functions do to files in `directory` instead of stdout:
+#   steps-<chunk>.npy/.csv      one row per agent decision: agent, state (row, col, has_block), action and reward
+#   episodes-<chunk>.npy/.csv   one row per terminal state: steps to terminal, total reward of all agents and whether
+#                               the experiment 4 pickup layout was in use (simulate4)
+#   q-<step>.npy                the q table every snapshot_every steps (never with snapshot_every=0)
+#   schema.json                 the columns, agent and action names, phases and the chunk files written so far
+#Records are kept in a list until chunk_size of them have come in and then written out as one chunk, so memory stays
+#the same however long the run is. The .npy chunks are structured arrays (np.load, or load_metrics for all of them at
+#once); format='csv' writes the same columns as CSV with a header instead.
+class MetricsSink:
+    def __init__(self, directory, chunk_size=65536, snapshot_every=0, format='npy'):
+        if format not in ('npy', 'csv'):
+            raise ValueError(f"Unknown metrics format {format}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.snapshot_every = snapshot_every
+        self.format = format
+        self.schema = {
+            'format': format,
+            'step_columns': [name for name, dtype in STEP_COLUMNS],
+            'episode_columns': [name for name, dtype in EPISODE_COLUMNS],
+            'agents': None,
+            'actions': None,
+            'phases': [],
+            'files': {'steps': [], 'episodes': [], 'q': []},
+        }
+        self.phase = -1
+        self.steps = 0
+        self.episodes = 0
+        self.episode_start = 0
+        self.episode_reward = 0.0
+        self.step_rows = []
+        self.episode_rows = []
+        self.q_values = None
+
+    def begin_phase(self, world, algorithm, policy):
+        self.phase += 1
+        self.q_values = algorithm.q_table.array
+        if self.schema['agents'] is None:
+            self.schema['agents'] = [agent.name for agent in world.agents.values()]
+            self.schema['actions'] = list(algorithm.actions)
+        self.schema['phases'].append({'policy': policy, 'start_step': self.steps})
+        # Like the episode_steps of the simulate functions, an episode is counted from the start of the phase
+        self.episode_start = self.steps
+        self.episode_reward = 0.0
+
+    def record(self, agent, position, has_block, action, reward):
+        self.step_rows.append((self.phase, self.steps, agent, position[0], position[1], int(has_block), action, reward))
+        self.episode_reward += reward
+        if len(self.step_rows) >= self.chunk_size:
+            self._write('steps', self.step_rows, STEP_COLUMNS)
+
+    def end_step(self):
+        self.steps += 1
+        if self.snapshot_every and self.steps % self.snapshot_every == 0:
+            self.snapshot()
+
+    def episode(self, experiment4=False):
+        self.episode_rows.append((self.phase, self.episodes, self.steps, self.steps - self.episode_start,
+                                  self.episode_reward, int(experiment4)))
+        self.episodes += 1
+        self.episode_start = self.steps
+        self.episode_reward = 0.0
+        if len(self.episode_rows) >= self.chunk_size:
+            self._write('episodes', self.episode_rows, EPISODE_COLUMNS)
+
+    def snapshot(self):
+        name = f"q-{self.steps:09d}.npy"
+        np.save(os.path.join(self.directory, name), self.q_values)
+        self.schema['files']['q'].append(name)
+
+    def _write(self, table, rows, columns):
+        name = f"{table}-{len(self.schema['files'][table]):06d}.{self.format}"
+        path = os.path.join(self.directory, name)
+        if self.format == 'npy':
+            np.save(path, np.array(rows, dtype=columns))
+        else:
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow([column for column, dtype in columns])
+                writer.writerows(rows)
+        self.schema['files'][table].append(name)
+        rows.clear()
+
+    def flush(self):
+        # Writes the records still buffered as a (short) chunk and brings schema.json up to date
+        if self.step_rows:
+            self._write('steps', self.step_rows, STEP_COLUMNS)
+        if self.episode_rows:
+            self._write('episodes', self.episode_rows, EPISODE_COLUMNS)
+        with open(os.path.join(self.directory, 'schema.json'), 'w') as f:
+            json.dump(self.schema, f, indent=2)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+#Reads a metrics directory back: {'steps': structured array, 'episodes': structured array, 'q': {step: array},
+#'schema': dict}. The chunks are concatenated, q snapshots are memory-mapped.
+def load_metrics(directory):
+    with open(os.path.join(directory, 'schema.json')) as f:
+        schema = json.load(f)
+    result = {'schema': schema}
+    for table, columns in (('steps', STEP_COLUMNS), ('episodes', EPISODE_COLUMNS)):
+        chunks = []
+        for name in schema['files'][table]:
+            path = os.path.join(directory, name)
+            if schema['format'] == 'npy':
+                chunks.append(np.load(path))
+            else:
+                chunks.append(np.atleast_1d(np.genfromtxt(path, delimiter=',', skip_header=1, dtype=columns)))
+        result[table] = np.concatenate(chunks) if chunks else np.zeros(0, dtype=columns)
+    result['q'] = {int(name[2:-4]): np.load(os.path.join(directory, name), mmap_mode='r') for name in schema['files']['q']}
+    return result
@@ -0,0 +1,146 @@
+import argparse
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from checkpoint import load_checkpoint
+from main import DEFAULT_WORLD_SPEC
+from qtable import QTable
+from runner import EXPERIMENTS, run_experiment
+from world_spec import normalize_world_spec
+
+
+ACTIONS = ['north', 'south', 'east', 'west', 'pickup', 'dropoff']
+
+
+#A QTable whose value and visited arrays live in one multiprocessing.shared_memory block: the float64 values
+#(rows x cols x 2 x actions) followed by one byte per value for visited. The process that creates it owns the block
+#and unlinks it on close, worker processes attach to it by name through handle(). The table cannot grow, so it has
+#to be created with the grid size of the world it is used on.
+class SharedQTable:
+    def __init__(self, grid_size, actions=ACTIONS, name=None):
+        self.actions = list(actions)
+        self.shape = (grid_size[0], grid_size[1], 2, len(self.actions))
+        size = int(np.prod(self.shape))
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=size * 9)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        array = np.ndarray(self.shape, dtype=np.float64, buffer=self.shm.buf)
+        visited = np.ndarray(self.shape, dtype=bool, buffer=self.shm.buf, offset=size * 8)
+        if self.owner:
+            array[...] = 0.0
+            visited[...] = False
+        self.q_table = QTable.from_arrays(array, visited, self.actions)
+
+    def handle(self):
+        return self.name, self.shape[:2], self.actions
+
+    @classmethod
+    def attach(cls, handle):
+        name, grid_size, actions = handle
+        return cls(grid_size, actions, name=name)
+
+    def copy(self):
+        # A plain QTable with a copy of the values, still usable after the shared block is gone
+        return QTable.from_arrays(self.q_table.array.copy(), self.q_table.visited.copy(), self.actions)
+
+    def close(self):
+        # The numpy views have to go before the block can be closed
+        self.q_table = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+#State of a worker process, set once by the pool initializer
+_shared = None
+_locks = None
+
+
+def _attach(handle, locks):
+    global _shared, _locks
+    _shared = SharedQTable.attach(handle)
+    _locks = locks
+
+
+def _rollout(task):
+    spec, seed = task
+    run = run_experiment(spec, seed, q_table=_shared.q_table, locks=_locks)
+    # The q table is the shared one, no need to send a copy of it back per run
+    del run['q_values'], run['q_visited']
+    return run
+
+
+#Trains one q table with many worker processes at once. Every seed is a run of the spec's schedule on its own PDWorld
+#and rng (exactly as runner.run_experiment does it), but all runs read and write the same SharedQTable, so the
+#experience of every run goes into one table. The Engine updates the shared values in place through a memoryview.
+#
+#With locks=0 the updates are lock-free (Hogwild): two runs updating the same entry at the same moment can lose one of
+#the two updates, which is rare and harmless for learning. locks=n stripes the table over n locks by state, each
+#update then holds the lock of its state while it reads and writes q(s, a). Both the Q-learning and the SARSA rule
+#work this way since the algorithm class comes from the spec.
+#
+#The order in which runs interleave depends on the OS scheduler, so unlike runner.py the shared table is not
+#reproducible per seed. initial is a QTable to start from, a spec with 'warm_start' starts from that checkpoint's q
+#table. Returns a plain QTable copy of the final values and the per run results (without q tables).
+def train_shared(spec, seeds, workers=None, locks=0, initial=None):
+    if isinstance(seeds, int):
+        seeds = list(range(seeds))
+    spec = dict(spec)
+    if spec.get('warm_start'):
+        initial = initial if initial is not None else load_checkpoint(spec['warm_start'].format(seed=seeds[0]), mmap=False)[0].q_table
+        del spec['warm_start']
+    grid_size = normalize_world_spec(spec.get('world') or DEFAULT_WORLD_SPEC)['grid_size']
+    if initial is not None:
+        grid_size = (max(grid_size[0], initial.grid_size[0]), max(grid_size[1], initial.grid_size[1]))
+
+    with SharedQTable(grid_size) as shared:
+        if initial is not None:
+            rows, cols = initial.grid_size
+            order = [initial.action_index[action] for action in shared.actions]
+            shared.q_table.array[:rows, :cols] = initial.array[..., order]
+            shared.q_table.visited[:rows, :cols] = initial.visited[..., order]
+        lock_list = [multiprocessing.Lock() for _ in range(locks)] if locks else None
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=(shared.handle(), lock_list)) as pool:
+            runs = list(pool.map(_rollout, [(spec, seed) for seed in seeds]))
+        q_table = shared.copy()
+    return q_table, runs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train one shared q table with many worker processes.")
+    parser.add_argument('experiment', help="experiment name (built in: %s)" % ', '.join(EXPERIMENTS))
+    parser.add_argument('--seeds', type=int, default=8, help="number of runs, each with its own world and seed")
+    parser.add_argument('--first-seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument('--locks', type=int, default=0, help="number of striped locks, 0 for lock-free updates")
+    parser.add_argument('--output', help="write the final q table to this .npz file")
+    args = parser.parse_args(argv)
+
+    spec = EXPERIMENTS[args.experiment]
+    seeds = list(range(args.first_seed, args.first_seed + args.seeds))
+    start = time.perf_counter()
+    q_table, runs = train_shared(spec, seeds, workers=args.workers, locks=args.locks)
+    seconds = time.perf_counter() - start
+    steps = sum(sum(run['steps_run']) for run in runs)
+    print(f"Experiment {args.experiment}: {len(runs)} runs, {steps} steps in {seconds:.2f}s ({steps / seconds:.0f} steps/s), "
+          f"terminal states {np.mean([run['total_terminal_states'] for run in runs]):.2f} per run")
+    if args.output:
+        np.savez_compressed(args.output, q_values=q_table.array, q_visited=q_table.visited)
+    return q_table, runs
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import heapq
+from collections import defaultdict
+
+
+#Dyna-Q planning with prioritized sweeping. The planner remembers the last observed outcome of every (state, action)
+#the agents tried, as (reward, next state, next action) in a dict keyed by the flat q table index, and after every real
+#update it runs up to planning_steps simulated backups on that model. Backups are done in order of the size of their
+#TD error: when Q(s, a) changes, every remembered (s', a') that leads into s gets its error recomputed and is queued
+#if it is above the threshold.
+#
+#Indices are flat positions in QTable.array (state_base + action, state_base = state * actions). Backups use the
+#algorithm's learning rate and discount factor and the same target as its update rule: the max over all actions of the
+#next state for Q-learning, the q value of the next action that was actually chosen for SARSA. The planner never draws
+#random numbers, so runs stay reproducible per seed.
+class PrioritizedSweeping:
+    def __init__(self, n_actions, planning_steps=10, threshold=1e-4, sarsa=False):
+        self.n_actions = n_actions
+        self.planning_steps = planning_steps
+        self.threshold = threshold
+        self.sarsa = sarsa
+        self.model = {}
+        self.predecessors = defaultdict(set)
+        self.queue = []
+        self.queued = {}
+        self.table_size = None
+        self.backups = 0
+
+    def reset(self):
+        self.model.clear()
+        self.predecessors.clear()
+        self.queue.clear()
+        self.queued.clear()
+
+    def _td_error(self, q, index, learning_rate, discount_factor):
+        reward, next_base, next_action = self.model[index]
+        if self.sarsa:
+            target = reward + discount_factor * q[next_base + next_action]
+        else:
+            target = reward + discount_factor * max(q[next_base:next_base + self.n_actions])
+        return target - q[index]
+
+    def _push(self, index, priority):
+        if priority > self.threshold and priority > self.queued.get(index, 0.0):
+            self.queued[index] = priority
+            heapq.heappush(self.queue, (-priority, index))
+
+    def _queue_predecessors(self, q, state_base, learning_rate, discount_factor):
+        for index in self.predecessors.get(state_base, ()):
+            self._push(index, abs(self._td_error(q, index, learning_rate, discount_factor)))
+
+    #Called right after the real update of q[index]. q is the flat table (memoryview or 1-D array).
+    def update(self, q, index, reward, next_base, next_action, learning_rate, discount_factor):
+        if len(q) != self.table_size:
+            # The q table was resized so every stored index is stale
+            self.reset()
+            self.table_size = len(q)
+        self.model[index] = (reward, next_base, next_action)
+        self.predecessors[next_base].add(index)
+        n_actions = self.n_actions
+        # The real update may still leave an error on this entry, and it changed the value of its state
+        self._push(index, abs(self._td_error(q, index, learning_rate, discount_factor)))
+        self._queue_predecessors(q, index - index % n_actions, learning_rate, discount_factor)
+
+        for _ in range(self.planning_steps):
+            while self.queue:
+                priority, index = heapq.heappop(self.queue)
+                if self.queued.get(index) == -priority:
+                    del self.queued[index]
+                    break
+            else:
+                return
+            q[index] = q[index] + learning_rate * self._td_error(q, index, learning_rate, discount_factor)
+            self.backups += 1
+            self._queue_predecessors(q, index - index % n_actions, learning_rate, discount_factor)
@@ -0,0 +1,59 @@
+from collections import defaultdict
+from time import perf_counter
+
+
+#Phases of one simulate step, in the order they happen
+PHASES = ['terminal_check', 'select_action', 'transition', 'update_q_table', 'render']
+
+
+#The StepProfiler is handed to the simulate functions to see where the time of a step goes. The loop calls start()
+#at the top of every step and lap(phase) after each piece of work, the time since the previous lap is added to that
+#phase. Times are kept as totals and counts so profiling a long run costs no memory.
+class StepProfiler:
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.steps = 0
+        self.last = None
+
+    def start(self):
+        self.steps += 1
+        self.last = perf_counter()
+
+    def lap(self, phase):
+        now = perf_counter()
+        self.totals[phase] += now - self.last
+        self.counts[phase] += 1
+        self.last = now
+
+    def report(self):
+        # {phase: {'total': seconds, 'count': laps, 'mean': seconds per lap, 'share': fraction of the profiled time}}
+        profiled = sum(self.totals.values())
+        report = {}
+        for phase in PHASES + [phase for phase in self.totals if phase not in PHASES]:
+            if phase in self.totals:
+                total = self.totals[phase]
+                report[phase] = {
+                    'total': total,
+                    'count': self.counts[phase],
+                    'mean': total / self.counts[phase],
+                    'share': total / profiled if profiled else 0.0,
+                }
+        return report
+
+    def print_report(self):
+        print(f"Profiled {self.steps} steps:")
+        for phase, times in self.report().items():
+            print(f"{phase:>15}: {times['total']:.4f}s total, {times['mean'] * 1e6:.2f}us per call, {times['share']:.1%}")
+
+
+#Used by the simulate functions when no profiler is given so the loop does not need to check for one
+class NullProfiler:
+    def start(self):
+        pass
+
+    def lap(self, phase):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,147 @@
+import random
+from collections.abc import MutableMapping
+
+import numpy as np
+
+
+#The QTable class replaces the plain dict our algorithms used to keep their q values in. Instead of hashing
+#((position, has_block), action) tuples on every lookup, the values live in one contiguous float array indexed by
+#[row, col, has_block, action]. A second boolean array remembers which entries have been written, so the table
+#can still be read like the old dict (items, keys, get, sorted(...)) and print_q_table prints exactly what it used to.
+class QTable(MutableMapping):
+    def __init__(self, grid_size=(5, 5), actions=['north', 'south', 'east', 'west', 'pickup', 'dropoff']):
+        self.actions = list(actions)
+        self.action_index = {action: i for i, action in enumerate(self.actions)}
+        self.array = np.zeros((grid_size[0], grid_size[1], 2, len(self.actions)), dtype=np.float64)
+        self.visited = np.zeros(self.array.shape, dtype=bool)
+        # applicable action lists repeat a lot, so we remember their index arrays
+        self._index_cache = {}
+
+    @classmethod
+    def from_arrays(cls, array, visited, actions):
+        # Wrap existing value/visited arrays (for example memory-mapped ones from a checkpoint) without copying them
+        q_table = cls((0, 0), actions)
+        q_table.array = array
+        q_table.visited = visited
+        return q_table
+
+    @property
+    def grid_size(self):
+        return self.array.shape[0], self.array.shape[1]
+
+    def resize(self, grid_size):
+        # Grow the table so it covers grid_size, keeping every value we already learned
+        rows = max(grid_size[0], self.array.shape[0])
+        cols = max(grid_size[1], self.array.shape[1])
+        if (rows, cols) == self.grid_size:
+            return
+        array = np.zeros((rows, cols, 2, len(self.actions)), dtype=np.float64)
+        visited = np.zeros(array.shape, dtype=bool)
+        old_rows, old_cols = self.grid_size
+        array[:old_rows, :old_cols] = self.array
+        visited[:old_rows, :old_cols] = self.visited
+        self.array = array
+        self.visited = visited
+
+    def contains_state(self, state):
+        position, has_block = state
+        return 0 <= position[0] < self.array.shape[0] and 0 <= position[1] < self.array.shape[1]
+
+    def state_values(self, state):
+        # Row of q values for every action in a state (a view into the table, not a copy)
+        position, has_block = state
+        return self.array[position[0], position[1], int(has_block)]
+
+    def value(self, state, action):
+        if not self.contains_state(state):
+            return 0
+        position, has_block = state
+        return self.array[position[0], position[1], int(has_block), self.action_index[action]]
+
+    def update(self, state, action, value):
+        position, has_block = state
+        if not self.contains_state(state):
+            self.resize((position[0] + 1, position[1] + 1))
+        index = (position[0], position[1], int(has_block), self.action_index[action])
+        self.array[index] = value
+        self.visited[index] = True
+
+    def state_base(self, state):
+        # Position of the first action of a state in the flattened table, the indices the Engine and the planner use
+        position, has_block = state
+        return ((position[0] * self.array.shape[1] + position[1]) * 2 + int(has_block)) * len(self.actions)
+
+    def flat_index(self, state, action):
+        return self.state_base(state) + self.action_index[action]
+
+    def flat_values(self):
+        # The table as one flat memoryview of floats, writes go straight into the array
+        return memoryview(self.array.reshape(-1))
+
+    def max_value(self, state):
+        # Same as max(q_table.get((state, a), 0) for a in actions) since unvisited entries are 0
+        if not self.contains_state(state):
+            return 0
+        return self.state_values(state).max()
+
+    def best_action(self, state, applicable_actions, rng=random):
+        # Vectorized argmax over the applicable actions, ties are broken randomly. The tie list keeps the order of
+        # applicable_actions so the random draw matches what the dict version picked for the same seed.
+        key = tuple(applicable_actions)
+        indices = self._index_cache.get(key)
+        if indices is None:
+            indices = np.array([self.action_index[action] for action in applicable_actions], dtype=np.intp)
+            self._index_cache[key] = indices
+        if not self.contains_state(state):
+            return rng.choice(applicable_actions)
+        candidates = self.state_values(state)[indices]
+        best_actions = np.flatnonzero(candidates == candidates.max())
+        return applicable_actions[rng.choice(best_actions)]
+
+    #The functions below are the dict-compatible view, keys look like ((row, col), has_block), action)
+    def _key_index(self, key):
+        state, action = key
+        if action not in self.action_index or not self.contains_state(state):
+            raise KeyError(key)
+        position, has_block = state
+        return (position[0], position[1], int(has_block), self.action_index[action])
+
+    def __getitem__(self, key):
+        index = self._key_index(key)
+        if not self.visited[index]:
+            raise KeyError(key)
+        return float(self.array[index])
+
+    def __setitem__(self, key, value):
+        state, action = key
+        self.update(state, action, value)
+
+    def __delitem__(self, key):
+        index = self._key_index(key)
+        if not self.visited[index]:
+            raise KeyError(key)
+        self.array[index] = 0
+        self.visited[index] = False
+
+    def __contains__(self, key):
+        try:
+            return bool(self.visited[self._key_index(key)])
+        except (KeyError, TypeError, ValueError):
+            return False
+
+    def __iter__(self):
+        for row, col, has_block, action in np.argwhere(self.visited):
+            yield ((int(row), int(col)), bool(has_block)), self.actions[action]
+
+    def __len__(self):
+        return int(self.visited.sum())
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def clear(self):
+        self.array.fill(0)
+        self.visited.fill(False)
@@ -0,0 +1,72 @@
+import itertools
+
+import numpy as np
+
+
+#BufferedRandom is a drop-in for the rng the worlds and algorithms take (seed, random and choice, like the random
+#module) that draws from a NumPy Generator instead. Uniform floats are drawn buffer_size at a time with one
+#Generator.random call and handed out one by one, choice picks seq[int(u * len(seq))] with the next of them, so a
+#decision costs no more than reading the next float from a list. random and choice are set per seed as attributes
+#(random is the __next__ of an iterator over the buffers), so code that binds rng.random or rng.choice to a local has
+#to bind them again after a seed call.
+#
+#A stream is fully determined by its seed: seed(s) starts the same numbers again, which is what the world reset relies
+#on. The world and the algorithm of a run share one stream because of that reseed, and every run gets its own through
+#the run's seed, so there are no child streams.
+class BufferedRandom:
+    def __init__(self, seed=None, buffer_size=4096):
+        self.buffer_size = buffer_size
+        self.seed_value = None
+        self._first = None
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        if seed is not None and seed == self.seed_value and self._first is not None:
+            # The world reseeds with the same seed on every reset, so the first buffer after it is kept and replayed
+            state, buffer = self._first
+            self.generator.bit_generator.state = state
+            self._start(buffer)
+            return
+        self.seed_value = seed
+        self._first = None
+        self.generator = np.random.Generator(np.random.PCG64(np.random.SeedSequence(seed)))
+        self._start([], first=True)
+
+    def _start(self, buffer, first=False):
+        # buffer holds already drawn numbers that are handed out before new ones are drawn
+        self._buffer = buffer
+        self._buffer_iter = iter(buffer)
+        draw = itertools.chain.from_iterable(self._buffers(first)).__next__
+
+        def choice(seq):
+            return seq[int(draw() * len(seq))]
+
+        self.random = draw
+        self.choice = choice
+
+    def _buffers(self, first):
+        yield self._buffer_iter
+        while True:
+            self._buffer = self.generator.random(self.buffer_size).tolist()
+            self._buffer_iter = iter(self._buffer)
+            if first:
+                self._first = (self.generator.bit_generator.state, self._buffer)
+                first = False
+            yield self._buffer_iter
+
+    def getstate(self):
+        # JSON-able state, the numbers still waiting in the buffer are part of it
+        remaining = self._buffer_iter.__length_hint__()
+        return {
+            'seed': self.seed_value,
+            'buffer_size': self.buffer_size,
+            'bit_generator': self.generator.bit_generator.state,
+            'buffer': self._buffer[len(self._buffer) - remaining:],
+        }
+
+    def setstate(self, state):
+        self.buffer_size = state['buffer_size']
+        self.seed_value = None
+        self.seed(state['seed'])
+        self.generator.bit_generator.state = state['bit_generator']
+        self._start(list(state['buffer']))
@@ -0,0 +1,106 @@
+import sys
+from collections import deque
+
+
+#The EventLog collects the pickup, dropoff and terminal state messages that used to be printed one by one.
+#Every message goes into a ring buffer holding the most recent `capacity` events (so a run can be looked at
+#afterwards without scrolling through the terminal) and, if echo is on, is written out in bulk every
+#`flush_every` messages. flush_every=1 prints each event right away, which is what the simulate functions did before.
+class EventLog:
+    def __init__(self, capacity=4096, flush_every=1, stream=None, echo=True):
+        self.records = deque(maxlen=capacity)
+        self.flush_every = flush_every
+        self.stream = stream
+        self.echo = echo
+        self.pending = []
+
+    def log(self, message):
+        self.records.append(message)
+        if self.echo:
+            self.pending.append(message)
+            if len(self.pending) >= self.flush_every:
+                self.flush()
+
+    def flush(self):
+        if self.pending:
+            stream = self.stream if self.stream is not None else sys.stdout
+            stream.write('\n'.join(self.pending) + '\n')
+            self.pending.clear()
+
+    def clear(self):
+        self.records.clear()
+        self.pending.clear()
+
+
+#The Renderer decides when the simulate functions draw the world. every=1 draws every step (the old behaviour),
+#every=k draws every k-th step and every=0 never draws (headless). With a path the frames are recorded to that file
+#instead of the terminal so a trajectory can be replayed later with replay(). The renderer owns the event log the
+#world writes its pickup/dropoff/terminal messages to. Its default log prints every event right away only for every=1,
+#any other renderer writes them in bulk, and a recording renderer writes them to the file between the frames.
+class Renderer:
+    def __init__(self, every=1, path=None, events=None, capacity=4096):
+        self.every = every
+        self.path = path
+        self.steps = 0
+        self.file = open(path, 'w') if path is not None else None
+        if events is None:
+            events = EventLog(capacity=capacity, flush_every=1 if every == 1 and path is None else capacity, stream=self.file)
+        self.events = events
+
+    @classmethod
+    def headless(cls, capacity=4096, echo=True):
+        # Nothing is drawn and events are only written in bulk once the buffer fills up or the phase ends
+        return cls(every=0, events=EventLog(capacity=capacity, flush_every=capacity, echo=echo))
+
+    @classmethod
+    def record(cls, path, every=1, capacity=4096):
+        return cls(every=every, path=path, capacity=capacity)
+
+    def due(self):
+        # Whether the next render call will actually draw, so callers can skip preparing the world otherwise
+        return bool(self.every) and (self.steps + 1) % self.every == 0
+
+    def render(self, world):
+        self.steps += 1
+        if not self.every or self.steps % self.every:
+            return
+        # Events of the steps before this frame go out first, so they stay in order with the frames
+        self.events.flush()
+        if self.file is not None:
+            self.file.write(f"step {self.steps}\n{world.render_text()}\n\n")
+        else:
+            world.display_world()
+
+    def finish(self):
+        # Called at the end of every simulate phase so nothing stays sitting in the buffers
+        self.events.flush()
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        self.finish()
+        if self.file is not None:
+            if self.events.stream is self.file:
+                # Anything the world logs after the recording ends goes to the terminal again
+                self.events.stream = None
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+#Prints the frames recorded by Renderer.record back in order, optionally waiting `delay` seconds between them
+def replay(path, delay=0):
+    import time
+    with open(path) as f:
+        frames = f.read().split('\n\n')
+    for frame in frames:
+        if frame.strip():
+            print(frame)
+            print()
+            if delay:
+                time.sleep(delay)
@@ -0,0 +1,222 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from checkpoint import resume_checkpoint, save_checkpoint
+from convergence import StoppingRule
+from metrics import MetricsSink
+from randomness import BufferedRandom
+from main import PDWorld, RLAlgorithm, Sarsa, simulate, simulate2, simulate4
+from render import Renderer
+
+
+ALGORITHMS = {'RLAlgorithm': RLAlgorithm, 'Sarsa': Sarsa}
+
+#The experiments from the bottom of main.py written as specs. A spec names the algorithm class, its learning rate and
+#discount factor, the policy schedule (a list of (policy, steps) phases run one after another on the same world and
+#q table) and whether the experiment 4 pickup switch is used. An optional 'world' entry gives a world spec (dict or JSON
+#path, see world_spec.py) to run on instead of the default 5x5 world. An optional 'warm_start' entry names a checkpoint
+#(see checkpoint.py, '{seed}' is replaced by the run's seed) whose q table, rng and world the schedule continues from,
+#for example the end of a shared 500 step PRandom phase, with the spec's algorithm and hyperparameters (the rng kind
+#has to match the checkpoint). 'planning_steps' turns on Dyna-Q planning (see planning.py).
+#'stopping' holds StoppingRule arguments (see convergence.py) to end every phase early once learning has settled.
+#'snapshot_every' sets how often the q table is written when metrics are streamed (see metrics.py). 'rng': 'buffered'
+#runs on a BufferedRandom (see randomness.py) instead of a random.Random.
+EXPERIMENTS = {
+    '1a': {'algorithm': 'RLAlgorithm', 'learning_rate': 0.3, 'discount_factor': 0.5,
+           'schedule': [('PRandom', 500), ('PRandom', 8500)], 'experiment4': False},
+    '1b': {'algorithm': 'RLAlgorithm', 'learning_rate': 0.3, 'discount_factor': 0.5,
+           'schedule': [('PRandom', 500), ('PGreedy', 8500)], 'experiment4': False},
+    '1c': {'algorithm': 'RLAlgorithm', 'learning_rate': 0.3, 'discount_factor': 0.5,
+           'schedule': [('PRandom', 500), ('PExploit', 8500)], 'experiment4': False},
+    '2': {'algorithm': 'Sarsa', 'learning_rate': 0.3, 'discount_factor': 0.5,
+          'schedule': [('PRandom', 500), ('PExploit', 8500)], 'experiment4': False},
+    '3': {'algorithm': 'Sarsa', 'learning_rate': 0.45, 'discount_factor': 0.5,
+          'schedule': [('PRandom', 500), ('PExploit', 8500)], 'experiment4': False},
+    '4': {'algorithm': 'RLAlgorithm', 'learning_rate': 0.3, 'discount_factor': 0.5,
+          'schedule': [('PRandom', 500), ('PExploit', 8500)], 'experiment4': True},
+}
+
+
+#Runs one spec with one seed the same way the commented out experiment blocks do. Every run gets its own
+#random.Random seeded with the run's seed, shared by the world and the algorithm, so runs never touch the global
+#random module and a (spec, seed) pair always gives the same result no matter which worker runs it.
+#With checkpoint_prefix a checkpoint is saved after every phase as '<prefix>_phase<i>.pdq'. q_table and locks make the
+#run learn into a table shared with other processes instead of its own (see parallel.py). With metrics_dir the steps,
+#episodes and q snapshots of the run are streamed to that directory (see metrics.py).
+def run_experiment(spec, seed, quiet=True, checkpoint_prefix=None, q_table=None, locks=None, metrics_dir=None):
+    renderer = Renderer.headless(echo=not quiet)
+    total_terminal = 0
+    algorithm_class = spec['algorithm']
+    if isinstance(algorithm_class, str):
+        algorithm_class = ALGORITHMS[algorithm_class]
+    rng_kind = spec.get('rng', 'random')
+    if spec.get('warm_start'):
+        path = spec['warm_start'].format(seed=seed)
+        world, loaded, header = resume_checkpoint(path, spec=spec.get('world'), events=renderer.events)
+        total_terminal = (header['extra'] or {}).get('terminal_states', 0)
+        saved_kind = 'buffered' if isinstance(loaded.rng, BufferedRandom) else 'random'
+        if saved_kind != rng_kind:
+            raise ValueError(f"Warm start {path} was saved with a {saved_kind} rng but the spec asks for {rng_kind}")
+        # The spec's algorithm and hyperparameters win over the ones saved in the checkpoint, only the q table and
+        # the rng state are carried on
+        rng = loaded.rng
+        algorithm = algorithm_class(learning_rate=spec['learning_rate'], discount_factor=spec['discount_factor'],
+                                    actions=loaded.actions, grid_size=loaded.q_table.grid_size, rng=rng,
+                                    planning_steps=spec.get('planning_steps', 0))
+        algorithm.q_table = loaded.q_table
+    else:
+        rng = BufferedRandom(seed) if rng_kind == 'buffered' else random.Random(seed)
+        world = PDWorld(randomseed=seed, events=renderer.events, rng=rng, spec=spec.get('world'))
+        algorithm = algorithm_class(learning_rate=spec['learning_rate'], discount_factor=spec['discount_factor'], rng=rng,
+                                    planning_steps=spec.get('planning_steps', 0))
+    if q_table is not None:
+        if q_table.grid_size[0] < world.grid_size[0] or q_table.grid_size[1] < world.grid_size[1]:
+            raise ValueError(f"Shared q table {q_table.grid_size} is smaller than the world {world.grid_size}")
+        algorithm.q_table = q_table
+        algorithm.locks = locks
+
+    stopping = StoppingRule(**spec['stopping']) if spec.get('stopping') else None
+    terminal_states = []
+    episode_steps = []
+    stops = []
+    output = contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext()
+    metrics = MetricsSink(metrics_dir, snapshot_every=spec.get('snapshot_every', 0)) if metrics_dir else None
+    with output, metrics if metrics is not None else contextlib.nullcontext():
+        for phase, (policy, steps) in enumerate(spec['schedule']):
+            if spec.get('experiment4'):
+                count = simulate4(world, algorithm, policy, steps, seed, total_terminal, renderer=renderer, episode_steps=episode_steps,
+                                  stopping=stopping, metrics=metrics, stops=stops)
+                terminal_states.append(count - total_terminal)
+                total_terminal = count
+            else:
+                if isinstance(algorithm, Sarsa):
+                    count = simulate2(world, algorithm, policy, steps, seed, renderer=renderer, episode_steps=episode_steps,
+                                      stopping=stopping, metrics=metrics, stops=stops)
+                else:
+                    count = simulate(world, algorithm, policy, steps, seed, renderer=renderer, episode_steps=episode_steps,
+                                     stopping=stopping, metrics=metrics, stops=stops)
+                terminal_states.append(count)
+                total_terminal += count
+            if checkpoint_prefix is not None:
+                save_checkpoint(f"{checkpoint_prefix}_phase{phase}.pdq", algorithm, world, extra={'terminal_states': total_terminal})
+
+    return {
+        'seed': seed,
+        'terminal_states': terminal_states,
+        'total_terminal_states': total_terminal,
+        'episode_steps': episode_steps,
+        'steps_run': [steps_run for steps_run, reason in stops],
+        'stop_reasons': [reason for steps_run, reason in stops],
+        'q_values': np.array(algorithm.q_table.array),
+        'q_visited': np.array(algorithm.q_table.visited),
+    }
+
+
+def _run_task(task):
+    name, spec, seed, checkpoint_dir, metrics_dir = task
+    prefix = os.path.join(checkpoint_dir, f"{name}_seed{seed}") if checkpoint_dir else None
+    metrics_dir = os.path.join(metrics_dir, f"{name}_seed{seed}") if metrics_dir else None
+    return name, run_experiment(spec, seed, checkpoint_prefix=prefix, metrics_dir=metrics_dir)
+
+
+#Combines the runs of one experiment into summary statistics, the mean q table is taken over all seeds
+def aggregate(runs):
+    totals = np.array([run['total_terminal_states'] for run in runs])
+    per_phase = np.array([run['terminal_states'] for run in runs])
+    episodes = np.array([steps for run in runs for steps in run['episode_steps']])
+    return {
+        'runs': len(runs),
+        'seeds': [run['seed'] for run in runs],
+        'terminal_states_mean': float(totals.mean()),
+        'terminal_states_std': float(totals.std()),
+        'terminal_states_per_phase_mean': per_phase.mean(axis=0).tolist(),
+        'episode_steps_mean': float(episodes.mean()) if len(episodes) else None,
+        'episode_steps_std': float(episodes.std()) if len(episodes) else None,
+        'episodes': int(len(episodes)),
+        'steps_run_per_phase_mean': np.array([run['steps_run'] for run in runs]).mean(axis=0).tolist(),
+        'q_values_mean': np.mean([run['q_values'] for run in runs], axis=0),
+    }
+
+
+#Python API: runs every (experiment, seed) pair on a process pool and returns {name: {'runs': [...], 'summary': {...}}}.
+#experiments maps names to specs, seeds is a list of ints (or a count, meaning seeds 0..n-1). With checkpoint_dir every
+#run saves a checkpoint after each phase as <checkpoint_dir>/<name>_seed<seed>_phase<i>.pdq, with metrics_dir every run
+#streams its metrics to <metrics_dir>/<name>_seed<seed>/.
+def run_experiments(experiments, seeds, workers=None, checkpoint_dir=None, metrics_dir=None):
+    if isinstance(seeds, int):
+        seeds = list(range(seeds))
+    if checkpoint_dir:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+    tasks = [(name, spec, seed, checkpoint_dir, metrics_dir) for name, spec in experiments.items() for seed in seeds]
+    results = {name: [] for name in experiments}
+    if workers == 1:
+        for name, run in map(_run_task, tasks):
+            results[name].append(run)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for name, run in pool.map(_run_task, tasks, chunksize=max(1, len(tasks) // (4 * (workers or os.cpu_count() or 1)))):
+                results[name].append(run)
+    return {name: {'runs': runs, 'summary': aggregate(runs)} for name, runs in results.items()}
+
+
+def _to_json(results):
+    output = {}
+    for name, result in results.items():
+        summary = dict(result['summary'])
+        summary['q_values_mean'] = summary['q_values_mean'].tolist()
+        runs = [{key: value for key, value in run.items() if key not in ('q_values', 'q_visited')} for run in result['runs']]
+        output[name] = {'summary': summary, 'runs': runs}
+    return output
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run PD world experiments across many seeds in parallel.")
+    parser.add_argument('experiments', nargs='*', help="experiment names, all of them by default (built in: %s)" % ', '.join(EXPERIMENTS))
+    parser.add_argument('--spec', help="JSON file mapping experiment names to specs, used instead of the built in ones")
+    parser.add_argument('--seeds', type=int, default=10, help="number of seeds per experiment")
+    parser.add_argument('--first-seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument('--output', help="write the aggregated results to this JSON file")
+    parser.add_argument('--q-tables', help="write the final q tables of every run to this .npz file")
+    parser.add_argument('--checkpoint-dir', help="save a checkpoint of every run after each phase in this directory")
+    parser.add_argument('--metrics-dir', help="stream the step and episode metrics of every run to this directory")
+    args = parser.parse_args(argv)
+
+    available = EXPERIMENTS
+    if args.spec:
+        with open(args.spec) as f:
+            available = json.load(f)
+    experiments = {name: available[name] for name in (args.experiments or available)}
+    seeds = list(range(args.first_seed, args.first_seed + args.seeds))
+
+    results = run_experiments(experiments, seeds, workers=args.workers, checkpoint_dir=args.checkpoint_dir,
+                              metrics_dir=args.metrics_dir)
+    for name, result in results.items():
+        summary = result['summary']
+        episode_steps = summary['episode_steps_mean']
+        print(f"Experiment {name}: {summary['runs']} runs, terminal states {summary['terminal_states_mean']:.2f} "
+              f"+/- {summary['terminal_states_std']:.2f}, steps per episode "
+              f"{'-' if episode_steps is None else f'{episode_steps:.1f}'}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(_to_json(results), f, indent=2)
+    if args.q_tables:
+        arrays = {}
+        for name, result in results.items():
+            for run in result['runs']:
+                arrays[f"{name}_seed{run['seed']}"] = run['q_values']
+                arrays[f"{name}_seed{run['seed']}_visited"] = run['q_visited']
+        np.savez_compressed(args.q_tables, **arrays)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+import numpy as np
+
+from qtable import QTable
+
+
+ACTIONS = ['north', 'south', 'east', 'west', 'pickup', 'dropoff']
+MOVES = {'north': (-1, 0), 'south': (1, 0), 'east': (0, 1), 'west': (0, -1)}
+
+
+#Exact baseline for the (position, has_block) state space RLAlgorithm learns over. The model follows Agent.move,
+#pickup and dropoff for one agent: moves stay inside the grid and cost -1, pickup is possible on a pickup cell
+#without a block and dropoff on a dropoff cell with one, both rewarded 13. Like the q table itself the state does
+#not include the other agents or the block counts, so the model assumes cells are free and pickup/dropoff cells
+#always have blocks/room. Value iteration runs on the whole table at once:
+#   Q(s, a) = R(a) + discount_factor * max over applicable a' of Q(s', a')
+#RLAlgorithm, Sarsa and the Engine back up the max over all actions instead, with the actions that can not be taken
+#never updated and so pinned at 0. Their tables converge to a different fixed point, learner_q_values:
+#   Q(s, a) = R(a) + discount_factor * max(0, max over applicable a' of Q(s', a'))
+#(every state has at least one action it can not take). Regret is always measured against the optimal values, distance
+#against either of the two.
+class ValueIterationSolution:
+    def __init__(self, q_values, applicable, discount_factor, actions, iterations, learner_q_values=None):
+        self.q_values = q_values          # rows x cols x 2 x actions, -inf where the action is not applicable
+        self.learner_q_values = learner_q_values
+        self.applicable = applicable      # same shape, True where the action is applicable
+        self.values = q_values.max(axis=-1)
+        self.discount_factor = discount_factor
+        self.actions = actions
+        self.iterations = iterations
+
+    def q_table(self):
+        # The optimal values as a QTable (applicable entries only) so they can be printed or used by RLAlgorithm
+        q_table = QTable(self.q_values.shape[:2], self.actions)
+        q_table.array[...] = np.where(self.applicable, self.q_values, 0.0)
+        q_table.visited[...] = self.applicable
+        return q_table
+
+    def greedy_policy(self):
+        # Index of the optimal action in every state, rows x cols x 2
+        return self.q_values.argmax(axis=-1)
+
+    def _learned(self, q_table):
+        # Learned values as an array shaped like q_values, from a QTable or the old dict format
+        shape = self.q_values.shape
+        if hasattr(q_table, 'array'):
+            learned = np.zeros(shape)
+            rows = min(shape[0], q_table.array.shape[0])
+            cols = min(shape[1], q_table.array.shape[1])
+            order = [q_table.action_index[action] for action in self.actions]
+            learned[:rows, :cols] = q_table.array[:rows, :cols][..., order]
+            return learned
+        learned = np.zeros(shape)
+        action_index = {action: i for i, action in enumerate(self.actions)}
+        for ((position, has_block), action), value in q_table.items():
+            if position[0] < shape[0] and position[1] < shape[1]:
+                learned[position[0], position[1], int(has_block), action_index[action]] = value
+        return learned
+
+    def regret(self, q_table):
+        # How much value acting greedily on a learned table gives up against the optimum, per state:
+        # V*(s) - Q*(s, a) where a is the learned greedy action (ties count as the average over the tied actions)
+        learned = np.where(self.applicable, self._learned(q_table), -np.inf)
+        ties = self.applicable & (learned == learned.max(axis=-1, keepdims=True))
+        chosen = np.where(ties, self.q_values, 0.0).sum(axis=-1) / ties.sum(axis=-1)
+        regret = self.values - chosen
+        return {
+            'mean_regret': float(regret.mean()),
+            'max_regret': float(regret.max()),
+            'optimal_fraction': float((regret <= 1e-9).mean()),
+            'per_state': regret,
+        }
+
+    def distance(self, q_table, target='optimal'):
+        # Error of the learned values on the applicable entries, against the optimal values or (target='learner') the
+        # fixed point the learners' update rule actually converges to
+        if target not in ('optimal', 'learner'):
+            raise ValueError(f"Unknown distance target {target}")
+        reference = self.q_values if target == 'optimal' else self.learner_q_values
+        difference = (self._learned(q_table) - reference)[self.applicable]
+        return {
+            'distance_target': target,
+            'rmse': float(np.sqrt(np.mean(difference ** 2))),
+            'max_abs': float(np.abs(difference).max()),
+            'mean_abs': float(np.abs(difference).mean()),
+        }
+
+    def score(self, q_table, target='optimal'):
+        # Regret and distance together, without the per state array. With the default target even a fully converged
+        # table keeps a distance above 0, see the note on learner_q_values above.
+        result = {key: value for key, value in self.regret(q_table).items() if key != 'per_state'}
+        result.update(self.distance(q_table, target))
+        return result
+
+
+#Builds the model of a world (grid size and pickup/dropoff cells of a PDWorld or a world spec) and solves it
+def solve(world, discount_factor=0.5, actions=ACTIONS, move_reward=-1, block_reward=13, tolerance=1e-12, max_iterations=100000):
+    if not 0 <= discount_factor < 1:
+        raise ValueError("Value iteration needs a discount factor in [0, 1)")
+    if isinstance(world, dict):
+        grid_size, pickup_cells, dropoff_cells = world['grid_size'], world['pickup_cells'], world['dropoff_cells']
+    else:
+        grid_size, pickup_cells, dropoff_cells = world.grid_size, world.pickup_cells, world.dropoff_cells
+    rows, cols = grid_size
+    actions = list(actions)
+    shape = (rows, cols, 2, len(actions))
+
+    applicable = np.zeros(shape, dtype=bool)
+    rewards = np.zeros(shape)
+    # Flat index of the next state (row, col, has_block) for every state and action
+    row_index, col_index, block_index = np.meshgrid(np.arange(rows), np.arange(cols), np.arange(2), indexing='ij')
+    next_state = np.zeros(shape, dtype=np.intp)
+    for a, action in enumerate(actions):
+        next_row, next_col, next_block = row_index, col_index, block_index
+        if action in MOVES:
+            dx, dy = MOVES[action]
+            next_row, next_col = row_index + dx, col_index + dy
+            inside = (next_row >= 0) & (next_row < rows) & (next_col >= 0) & (next_col < cols)
+            applicable[..., a] = inside
+            rewards[..., a] = move_reward
+            next_row, next_col = np.clip(next_row, 0, rows - 1), np.clip(next_col, 0, cols - 1)
+        elif action == 'pickup':
+            for position in pickup_cells:
+                applicable[position[0], position[1], 0, a] = True
+            rewards[..., a] = block_reward
+            next_block = np.ones_like(block_index)
+        elif action == 'dropoff':
+            for position in dropoff_cells:
+                applicable[position[0], position[1], 1, a] = True
+            rewards[..., a] = block_reward
+            next_block = np.zeros_like(block_index)
+        next_state[..., a] = (next_row * cols + next_col) * 2 + next_block
+
+    def iterate(learner):
+        q_values = np.where(applicable, 0.0, -np.inf)
+        for iteration in range(1, max_iterations + 1):
+            values = q_values.max(axis=-1)
+            if learner:
+                values = np.maximum(values, np.where(applicable.all(axis=-1), -np.inf, 0.0))
+            updated = np.where(applicable, rewards + discount_factor * values.reshape(-1)[next_state], -np.inf)
+            change = np.abs(updated[applicable] - q_values[applicable]).max()
+            q_values = updated
+            if change < tolerance:
+                break
+        return q_values, iteration
+
+    q_values, iterations = iterate(False)
+    learner_q_values, _ = iterate(True)
+    return ValueIterationSolution(q_values, applicable, discount_factor, actions, iterations, learner_q_values)
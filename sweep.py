@@ -0,0 +1,198 @@
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+import random
+
+from runner import run_experiments
+
+
+#Values tried for every hyperparameter. explore_fraction is the share of a trial's steps spent in the PRandom phase
+#before switching to exploit_policy (the experiments in main.py use 500 of 9000 steps).
+SEARCH_SPACE = {
+    'algorithm': ['RLAlgorithm', 'Sarsa'],
+    'learning_rate': [0.1, 0.3, 0.45, 0.6],
+    'discount_factor': [0.3, 0.5, 0.7, 0.9],
+    'explore_fraction': [0.05, 0.1, 0.25],
+    'exploit_policy': ['PExploit', 'PGreedy'],
+}
+
+#Hyperparameters a search space leaves out keep the values of experiment 1c
+DEFAULT_CONFIG = {'algorithm': 'RLAlgorithm', 'learning_rate': 0.3, 'discount_factor': 0.5, 'explore_fraction': 500 / 9000,
+                  'exploit_policy': 'PExploit'}
+
+TABLE_COLUMNS = ['rung', 'budget', 'trial', 'algorithm', 'learning_rate', 'discount_factor', 'explore_fraction',
+                 'exploit_policy', 'seeds', 'terminal_states_mean', 'terminal_states_per_step', 'episode_steps_mean']
+
+
+#All combinations of the search space, or n_trials of them picked at random (reproducible with sample_seed)
+def sample_configs(space=SEARCH_SPACE, n_trials=None, sample_seed=0):
+    keys = list(space)
+    configs = [dict(DEFAULT_CONFIG, **dict(zip(keys, values))) for values in itertools.product(*(space[key] for key in keys))]
+    if n_trials is not None and n_trials < len(configs):
+        configs = random.Random(sample_seed).sample(configs, n_trials)
+    return configs
+
+
+def trial_name(config):
+    return (f"{config['algorithm']}_lr{config['learning_rate']}_df{config['discount_factor']}"
+            f"_x{config['explore_fraction']:.3g}_{config['exploit_policy']}")
+
+
+#A runner spec running a config for `budget` steps in total, split into the PRandom and exploit phases
+def trial_spec(config, budget, world=None, experiment4=False, stopping=None):
+    explore = min(budget - 1, max(1, round(budget * config['explore_fraction'])))
+    spec = {
+        'algorithm': config['algorithm'],
+        'learning_rate': config['learning_rate'],
+        'discount_factor': config['discount_factor'],
+        'schedule': [('PRandom', explore), (config['exploit_policy'], budget - explore)],
+        'experiment4': experiment4,
+    }
+    if world is not None:
+        spec['world'] = world
+    if stopping:
+        spec['stopping'] = stopping
+    return spec
+
+
+#Budgets of the rungs: min_budget, min_budget * eta, ... with the last rung at max_budget
+def rung_budgets(min_budget, max_budget, eta=3):
+    rungs = int(math.floor(math.log(max_budget / min_budget, eta) + 1e-9)) + 1
+    budgets = [int(min_budget * eta ** rung) for rung in range(rungs)]
+    budgets[-1] = max_budget
+    return budgets
+
+
+#Everything besides the config and budget that changes what a trial scores, as it goes into the results file. A world
+#given as a spec file is stored with its contents, so editing the file counts as a different sweep too.
+def sweep_settings(seeds, world, experiment4, stopping, min_budget, max_budget, eta):
+    if isinstance(world, str):
+        with open(world) as f:
+            world = {'path': world, 'spec': json.load(f)}
+    settings = {'seeds': list(seeds), 'world': world, 'experiment4': bool(experiment4), 'stopping': stopping or None,
+                'min_budget': min_budget, 'max_budget': max_budget, 'eta': eta}
+    # Compared with what json.load gives back, so tuples and lists match
+    return json.loads(json.dumps(settings))
+
+
+#The first line of a results file holds the settings of the sweep that wrote it, the rest are finished trials. A file
+#written with other settings is refused, its rows would be reused for trials that never ran with these settings.
+def _load_results(path, settings):
+    done = {}
+    if not path or not os.path.exists(path):
+        return done
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if not records:
+        return done
+    saved = records[0].get('settings')
+    if saved != settings:
+        raise ValueError(f"{path} holds results of a sweep with other settings ({saved}), "
+                         f"use another results file or remove it to run with {settings}")
+    for record in records[1:]:
+        done[(record['trial'], record['budget'])] = record
+    return done
+
+
+#Successive halving: every config gets the smallest budget, then only the best 1/eta of them (by terminal states
+#reached per step, averaged over the seeds) go on to the next rung with eta times the steps, until the survivors run
+#with max_budget. Each rung runs all its (config, seed) pairs in parallel with runner.run_experiments.
+#
+#Every finished (trial, budget) is appended to results_path as one JSON line as soon as its rung completes. Running the
+#same sweep again with the same results_path skips everything already in the file, so an interrupted sweep picks up
+#at the rung it stopped in (runs are deterministic per seed, so the promotions come out the same). The file starts with
+#the sweep settings (seeds, world, experiment4, stopping and budgets), resuming with other settings raises ValueError.
+def successive_halving(configs, min_budget, max_budget, eta=3, seeds=3, workers=None, world=None, experiment4=False,
+                       stopping=None, results_path=None, quiet=True):
+    if isinstance(seeds, int):
+        seeds = list(range(seeds))
+    settings = sweep_settings(seeds, world, experiment4, stopping, min_budget, max_budget, eta)
+    done = _load_results(results_path, settings)
+    if results_path and not (os.path.exists(results_path) and os.path.getsize(results_path)):
+        with open(results_path, 'w') as f:
+            f.write(json.dumps({'settings': settings}) + '\n')
+    table = []
+    survivors = list(configs)
+    for rung, budget in enumerate(rung_budgets(min_budget, max_budget, eta)):
+        pending = {trial_name(config): trial_spec(config, budget, world, experiment4, stopping)
+                   for config in survivors if (trial_name(config), budget) not in done}
+        if pending:
+            results = run_experiments(pending, seeds, workers=workers)
+            records = []
+            for name, result in results.items():
+                summary = result['summary']
+                # Early stopped phases count with the steps they actually ran
+                steps = sum(sum(run['steps_run']) for run in result['runs'])
+                records.append({
+                    'trial': name,
+                    'budget': budget,
+                    'seeds': len(result['runs']),
+                    'terminal_states_mean': summary['terminal_states_mean'],
+                    'terminal_states_per_step': summary['terminal_states_mean'] * len(result['runs']) / steps,
+                    'episode_steps_mean': summary['episode_steps_mean'],
+                })
+            for record in records:
+                done[(record['trial'], budget)] = record
+            if results_path:
+                with open(results_path, 'a') as f:
+                    f.writelines(json.dumps(record) + '\n' for record in records)
+
+        scored = []
+        for config in survivors:
+            record = done[(trial_name(config), budget)]
+            scored.append((config, record))
+            table.append(dict(config, rung=rung, **record))
+        # Ties keep the order of configs, so the promotions do not depend on the worker pool
+        scored.sort(key=lambda item: -item[1]['terminal_states_per_step'])
+        if not quiet:
+            best_config, best = scored[0]
+            print(f"Rung {rung}: {len(scored)} trials with {budget} steps, best {best['terminal_states_per_step']:.5f} "
+                  f"terminal states per step ({trial_name(best_config)})")
+        survivors = [config for config, record in scored[:max(1, math.ceil(len(scored) / eta))]]
+    return table
+
+
+#Writes the sweep results as CSV, best trials of the highest rung first
+def write_table(table, path):
+    rows = sorted(table, key=lambda row: (-row['rung'], -row['terminal_states_per_step']))
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=TABLE_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tune learning rate, discount factor and policy schedule with successive halving.")
+    parser.add_argument('--space', help="JSON file with the search space (lists of values per hyperparameter)")
+    parser.add_argument('--trials', type=int, default=None, help="number of configs sampled from the space (default: all)")
+    parser.add_argument('--sample-seed', type=int, default=0)
+    parser.add_argument('--min-budget', type=int, default=1000, help="steps per trial in the first rung")
+    parser.add_argument('--max-budget', type=int, default=9000, help="steps per trial in the last rung")
+    parser.add_argument('--eta', type=int, default=3, help="keep the best 1/eta trials per rung")
+    parser.add_argument('--seeds', type=int, default=3, help="seeds per trial")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument('--world', help="world spec JSON file to tune on (default: the 5x5 world)")
+    parser.add_argument('--experiment4', action='store_true', help="run the trials with the experiment 4 pickup switch")
+    parser.add_argument('--results', default='sweep_results.jsonl', help="finished trials, a sweep resumes from this file")
+    parser.add_argument('--table', default='sweep_table.csv', help="write the results table to this CSV file")
+    args = parser.parse_args(argv)
+
+    space = SEARCH_SPACE
+    if args.space:
+        with open(args.space) as f:
+            space = json.load(f)
+    configs = sample_configs(space, args.trials, args.sample_seed)
+    table = successive_halving(configs, args.min_budget, args.max_budget, eta=args.eta, seeds=args.seeds,
+                               workers=args.workers, world=args.world, experiment4=args.experiment4,
+                               results_path=args.results, quiet=False)
+    write_table(table, args.table)
+    best = max((row for row in table if row['rung'] == table[-1]['rung']), key=lambda row: row['terminal_states_per_step'])
+    print(f"Best: {best['trial']} with {best['terminal_states_per_step']:.5f} terminal states per step")
+    return table
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+import numpy as np
+
+from main import DEFAULT_WORLD_SPEC
+from qtable import QTable
+from world_spec import normalize_world_spec
+
+
+#Actions are encoded as ints in the same order RLAlgorithm uses by default, the first four are moves
+ACTIONS = ['north', 'south', 'east', 'west', 'pickup', 'dropoff']
+PICKUP, DROPOFF = 4, 5
+MOVES = np.array([(-1, 0), (1, 0), (0, 1), (0, -1)])
+MOVE_REWARD = -1
+BLOCK_REWARD = 13
+
+
+#VecPDWorld holds N independent copies of our PD world in NumPy arrays instead of Agent objects and dicts.
+#Agents are addressed by slot (0 = red, 1 = blue, 2 = black, same order as PDWorld.agents) and every call to step
+#moves that slot in all N worlds at once. The rules are the same as Agent.move, pickup and dropoff: a move only
+#happens if the cell is in bounds and free of the other agents, and a pickup/dropoff only happens if the cell has
+#blocks left/room left and the agent is empty/carrying. All N worlds share one layout given as a world spec.
+class VecPDWorld:
+    def __init__(self, n_worlds, experiment4=False, seed=None, spec=None):
+        spec = normalize_world_spec(spec) if spec is not None else DEFAULT_WORLD_SPEC
+        self.n_worlds = n_worlds
+        self.grid_size = spec['grid_size']
+        self.experiment4 = experiment4
+        self.agent_names = [name for key, name, position in spec['agents']]
+        self.start_positions = np.array([position for key, name, position in spec['agents']])
+        self.n_agents = len(self.start_positions)
+        self.rng = np.random.default_rng(seed)
+
+        pickup_cells = spec['pickup_cells']
+        if experiment4 and spec['experiment4_pickup_cells'] is not None:
+            pickup_cells = spec['experiment4_pickup_cells']
+        # Blocks every pickup cell starts with and blocks every dropoff cell can hold
+        self.pickup_blocks = np.array(list(pickup_cells.values()), dtype=np.intp)
+        self.capacity = np.array(list(spec['dropoff_cells'].values()), dtype=np.intp)
+        # For every cell, the index of its pickup/dropoff counter or -1 when it is not one
+        self.pickup_index = np.full(self.grid_size, -1)
+        for i, position in enumerate(pickup_cells):
+            self.pickup_index[position] = i
+        self.dropoff_index = np.full(self.grid_size, -1)
+        for i, position in enumerate(spec['dropoff_cells']):
+            self.dropoff_index[position] = i
+
+        self.positions = np.empty((n_worlds, self.n_agents, 2), dtype=np.intp)
+        self.has_block = np.zeros((n_worlds, self.n_agents), dtype=bool)
+        self.pickup_counts = np.empty((n_worlds, len(self.pickup_blocks)), dtype=np.intp)
+        self.dropoff_counts = np.empty((n_worlds, len(self.capacity)), dtype=np.intp)
+        self.terminal_counts = np.zeros(n_worlds, dtype=np.intp)
+        self.episode_steps = np.zeros(n_worlds, dtype=np.intp)
+        # (world, steps) for every finished episode, in the order they finished
+        self.finished_episodes = []
+        self.worlds = np.arange(n_worlds)
+        self.reset()
+
+    def reset(self, mask=None):
+        # Put the masked worlds (all of them by default) back to their starting layout
+        if mask is None:
+            mask = np.ones(self.n_worlds, dtype=bool)
+        self.positions[mask] = self.start_positions
+        self.has_block[mask] = False
+        self.pickup_counts[mask] = self.pickup_blocks
+        self.dropoff_counts[mask] = 0
+        self.episode_steps[mask] = 0
+
+    def check_terminal_state(self):
+        all_picked = (self.pickup_counts == 0).all(axis=1)
+        all_dropped = (self.dropoff_counts == self.capacity).all(axis=1)
+        return all_picked & all_dropped
+
+    def reset_terminal_worlds(self):
+        # Same as the check at the top of every simulate step: finished worlds are counted and start over
+        done = self.check_terminal_state()
+        if done.any():
+            self.terminal_counts += done
+            self.finished_episodes.extend(zip(self.worlds[done].tolist(), self.episode_steps[done].tolist()))
+            self.reset(done)
+        self.episode_steps += 1
+        return done
+
+    def states(self, slot):
+        # (rows, cols, has_block) arrays of the agent in this slot for every world
+        return self.positions[:, slot, 0], self.positions[:, slot, 1], self.has_block[:, slot]
+
+    def applicable_mask(self, slot):
+        # (N, 6) boolean array of the actions get_applicable_actions would allow, in ACTIONS order
+        rows, cols, carrying = self.states(slot)
+        mask = np.zeros((self.n_worlds, len(ACTIONS)), dtype=bool)
+        mask[:, 0] = rows > 0
+        mask[:, 1] = rows < self.grid_size[0] - 1
+        mask[:, 2] = cols < self.grid_size[1] - 1
+        mask[:, 3] = cols > 0
+        pickup = self.pickup_index[rows, cols]
+        mask[:, PICKUP] = (pickup >= 0) & ~carrying & (self.pickup_counts[self.worlds, pickup] > 0)
+        dropoff = self.dropoff_index[rows, cols]
+        mask[:, DROPOFF] = (dropoff >= 0) & carrying & (self.dropoff_counts[self.worlds, dropoff] < self.capacity[dropoff])
+        return mask
+
+    def step(self, slot, actions):
+        # Apply one action per world to the agent in this slot and return the rewards
+        actions = np.asarray(actions)
+        position = self.positions[:, slot]
+
+        moving = actions < PICKUP
+        new_position = position + MOVES[np.where(moving, actions, 0)]
+        in_bounds = ((new_position >= 0) & (new_position < self.grid_size)).all(axis=1)
+        others = np.delete(self.positions, slot, axis=1)
+        occupied = (others == new_position[:, None]).all(axis=2).any(axis=1)
+        moved = moving & in_bounds & ~occupied
+        position[moved] = new_position[moved]
+
+        rows, cols = position[:, 0], position[:, 1]
+        carrying = self.has_block[:, slot]
+        pickup = self.pickup_index[rows, cols]
+        picked = (actions == PICKUP) & (pickup >= 0) & ~carrying
+        picked &= self.pickup_counts[self.worlds, pickup] > 0
+        self.pickup_counts[self.worlds[picked], pickup[picked]] -= 1
+        dropoff = self.dropoff_index[rows, cols]
+        dropped = (actions == DROPOFF) & (dropoff >= 0) & carrying
+        dropped &= self.dropoff_counts[self.worlds, dropoff] < self.capacity[dropoff]
+        self.dropoff_counts[self.worlds[dropped], dropoff[dropped]] += 1
+        self.has_block[:, slot] = (carrying | picked) & ~dropped
+
+        return np.where(moving, MOVE_REWARD, BLOCK_REWARD)
+
+    def select_actions(self, slot, policy, q_values=None):
+        # Batched version of RLAlgorithm.select_action, q_values holds one q table per world
+        # with shape (N, rows, cols, 2, 6). Random scores pick uniformly among the allowed actions and break ties.
+        mask = self.applicable_mask(slot)
+        scores = self.rng.random(mask.shape)
+        random_actions = np.where(mask, scores, -1.0).argmax(axis=1)
+        if policy == 'PRandom':
+            return random_actions
+        rows, cols, carrying = self.states(slot)
+        q = np.where(mask, q_values[self.worlds, rows, cols, carrying.astype(np.intp)], -np.inf)
+        ties = mask & (q == q.max(axis=1, keepdims=True))
+        greedy_actions = np.where(ties, scores, -1.0).argmax(axis=1)
+        if policy == 'PGreedy':
+            return greedy_actions
+        if policy == 'PExploit':
+            exploit = self.rng.random(self.n_worlds) < 0.8
+            return np.where(exploit, greedy_actions, random_actions)
+        raise ValueError(f"Unknown policy {policy}")
+
+    def new_q_values(self):
+        return np.zeros((self.n_worlds, self.grid_size[0], self.grid_size[1], 2, len(ACTIONS)))
+
+
+#vec_simulate runs the Q-learning loop from simulate for all N worlds at once. Every world has its own q table
+#(q_values[n]) and worlds that reach the terminal state are reset on their own, so the returned terminal counts and
+#finished episodes are per world. visited tracks which entries were written, like QTable.visited.
+def vec_simulate(vec_world, q_values, policy, steps, learning_rate=0.3, discount_factor=0.5, visited=None):
+    worlds = vec_world.worlds
+    for step in range(steps):
+        vec_world.reset_terminal_worlds()
+        for slot in range(vec_world.n_agents):
+            rows, cols, carrying = (array.copy() for array in vec_world.states(slot))
+            blocks = carrying.astype(np.intp)
+            actions = vec_world.select_actions(slot, policy, q_values)
+            rewards = vec_world.step(slot, actions)
+            next_rows, next_cols, next_carrying = vec_world.states(slot)
+            next_max = q_values[worlds, next_rows, next_cols, next_carrying.astype(np.intp)].max(axis=1)
+            current = q_values[worlds, rows, cols, blocks, actions]
+            q_values[worlds, rows, cols, blocks, actions] = current + learning_rate * (rewards + discount_factor * next_max - current)
+            if visited is not None:
+                visited[worlds, rows, cols, blocks, actions] = True
+    return vec_world.terminal_counts
+
+
+#Copies the q table of one world out of a batch into a QTable so it can be printed or used by RLAlgorithm
+def to_qtable(q_values, world, visited=None):
+    q_table = QTable(q_values.shape[1:3], ACTIONS)
+    q_table.array[...] = q_values[world]
+    if visited is not None:
+        q_table.visited[...] = visited[world]
+    else:
+        q_table.visited[...] = q_values[world] != 0
+    return q_table
@@ -0,0 +1,138 @@
+import json
+import random
+
+
+#A world spec describes the layout of a PD world: the grid size, the agents and where they start, and the pickup
+#and dropoff cells with how many blocks they start with / can hold. It is a plain dict so it can be written as JSON:
+#
+#   {
+#     "grid_size": [50, 50],
+#     "capacity": 5,
+#     "agents": [{"key": "red", "name": "Red", "start": [2, 2]}, ...],
+#     "pickup_cells": [{"position": [0, 4], "blocks": 5}, ...],
+#     "dropoff_cells": [{"position": [0, 0], "capacity": 5}, ...],
+#     "experiment4_pickup_cells": [...]
+#   }
+#
+#capacity is used for every cell that does not give its own blocks/capacity, and cells can also be given as just
+#[row, col]. experiment4_pickup_cells is optional, it is the pickup layout used when a world is made with
+#experiment4=True (without it the normal pickup cells are kept). Agents without a key use their name in lower case.
+#The world only reaches its terminal state if the pickup cells hold as many blocks as the dropoff cells can take.
+
+def _position(value):
+    return (int(value[0]), int(value[1]))
+
+
+def _cells(cells, amount_key, default):
+    result = {}
+    for cell in cells:
+        if isinstance(cell, dict):
+            position = _position(cell['position'])
+            amount = int(cell.get(amount_key, default))
+        else:
+            position = _position(cell)
+            amount = default
+        if position in result:
+            raise ValueError(f"Cell {position} is listed twice")
+        result[position] = amount
+    return result
+
+
+#Turns a spec as written by a user (dict or JSON file path) into the form PDWorld uses: tuples for positions, an
+#ordered list of (key, name, start) agents and {position: amount} dicts for the cells. The spec is checked so a bad
+#layout fails here instead of in the middle of a simulation.
+def normalize_world_spec(spec):
+    if isinstance(spec, str):
+        return load_world_spec(spec)
+    grid_size = _position(spec['grid_size'])
+    capacity = int(spec.get('capacity', 5))
+
+    agents = []
+    for agent in spec['agents']:
+        if isinstance(agent, dict):
+            name = agent.get('name', agent.get('key'))
+            key = agent.get('key', name.lower())
+            start = _position(agent['start'])
+        else:
+            key, name, start = agent[0], agent[1], _position(agent[2])
+        agents.append((key, name, start))
+
+    pickup_cells = _cells(spec['pickup_cells'], 'blocks', capacity)
+    dropoff_cells = _cells(spec['dropoff_cells'], 'capacity', capacity)
+    experiment4_pickup_cells = None
+    if spec.get('experiment4_pickup_cells') is not None:
+        experiment4_pickup_cells = _cells(spec['experiment4_pickup_cells'], 'blocks', capacity)
+
+    def check(position, what):
+        if not (0 <= position[0] < grid_size[0] and 0 <= position[1] < grid_size[1]):
+            raise ValueError(f"{what} {position} is outside the {grid_size[0]}x{grid_size[1]} grid")
+
+    starts = set()
+    for key, name, start in agents:
+        check(start, f"Agent {name} start")
+        if start in starts:
+            raise ValueError(f"Two agents start at {start}")
+        starts.add(start)
+    if len({key for key, name, start in agents}) != len(agents):
+        raise ValueError("Agent keys must be unique")
+    for cells, what in ((pickup_cells, 'Pickup cell'), (dropoff_cells, 'Dropoff cell'), (experiment4_pickup_cells or {}, 'Pickup cell')):
+        for position in cells:
+            check(position, what)
+
+    return {
+        'grid_size': grid_size,
+        'capacity': capacity,
+        'agents': agents,
+        'pickup_cells': pickup_cells,
+        'dropoff_cells': dropoff_cells,
+        'experiment4_pickup_cells': experiment4_pickup_cells,
+    }
+
+
+def load_world_spec(path):
+    with open(path) as f:
+        return normalize_world_spec(json.load(f))
+
+
+def save_world_spec(spec, path):
+    spec = normalize_world_spec(spec)
+
+    def cells(cells, amount_key):
+        return [{'position': list(position), amount_key: amount} for position, amount in cells.items()]
+
+    data = {
+        'grid_size': list(spec['grid_size']),
+        'capacity': spec['capacity'],
+        'agents': [{'key': key, 'name': name, 'start': list(start)} for key, name, start in spec['agents']],
+        'pickup_cells': cells(spec['pickup_cells'], 'blocks'),
+        'dropoff_cells': cells(spec['dropoff_cells'], 'capacity'),
+    }
+    if spec['experiment4_pickup_cells'] is not None:
+        data['experiment4_pickup_cells'] = cells(spec['experiment4_pickup_cells'], 'blocks')
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+#Builds a random warehouse layout for scaling tests, e.g. generate_world_spec((100, 100), 24, 20, 20). Agents,
+#pickup cells and dropoff cells all get distinct cells, and the pickups hold exactly what the dropoffs can take.
+def generate_world_spec(grid_size, n_agents, n_pickups, n_dropoffs, capacity=5, seed=0):
+    rows, cols = grid_size
+    if n_agents + n_pickups + n_dropoffs > rows * cols:
+        raise ValueError("Not enough cells for that many agents, pickups and dropoffs")
+    rng = random.Random(seed)
+    cells = rng.sample(range(rows * cols), n_agents + n_pickups + n_dropoffs)
+    positions = [[cell // cols, cell % cols] for cell in cells]
+    agents = positions[:n_agents]
+    pickups = positions[n_agents:n_agents + n_pickups]
+    dropoffs = positions[n_agents + n_pickups:]
+
+    # Spread the blocks over the pickup cells so the totals match
+    total = n_dropoffs * capacity
+    blocks = [total // n_pickups + (1 if i < total % n_pickups else 0) for i in range(n_pickups)]
+    return normalize_world_spec({
+        'grid_size': [rows, cols],
+        'capacity': capacity,
+        'agents': [{'key': f"agent{i}", 'name': f"Agent{i}", 'start': start} for i, start in enumerate(agents)],
+        'pickup_cells': [{'position': position, 'blocks': amount} for position, amount in zip(pickups, blocks)],
+        'dropoff_cells': dropoffs,
+    })